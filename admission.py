@@ -0,0 +1,196 @@
+# admission.py
+
+import os
+import json
+import math
+import time
+import random
+import threading
+import openai
+import metrics
+
+# Org-wide limits per model; each gunicorn worker enforces its share.
+DEFAULT_RATE_LIMITS = {
+    "gpt-4": {"rpm": 500, "tpm": 40000},
+    "gpt-4-turbo": {"rpm": 500, "tpm": 300000},
+    "gpt-4o": {"rpm": 500, "tpm": 300000},
+    "gpt-4o-mini": {"rpm": 500, "tpm": 2000000},
+    "gpt-3.5-turbo": {"rpm": 3500, "tpm": 2000000}
+}
+# gunicorn.conf.py exports its worker count as WEB_CONCURRENCY; a lone `python app.py` is one process.
+WORKER_SHARE = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 32))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", 10))
+ADMISSION_BURST_SECONDS = float(os.getenv("ADMISSION_BURST_SECONDS", 10))
+ADMISSION_MAX_RETRIES = int(os.getenv("ADMISSION_MAX_RETRIES", 3))
+ADMISSION_OUTPUT_TOKEN_ESTIMATE = int(os.getenv("ADMISSION_OUTPUT_TOKEN_ESTIMATE", 400))
+
+
+class Busy(Exception):
+    """Raised when a request is shed instead of being sent to OpenAI."""
+
+    def __init__(self, reason, retry_after=ADMISSION_MAX_WAIT_SECONDS):
+        super().__init__(f"OpenAI capacity exhausted ({reason})")
+        self.reason = reason
+        # Whole seconds until capacity frees up, as sent in Retry-After.
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def load_rate_limits():
+    """Default RPM/TPM table, overridden per model by the OPENAI_RATE_LIMITS JSON env var."""
+    limits = {model: dict(limit) for model, limit in DEFAULT_RATE_LIMITS.items()}
+    override = os.getenv("OPENAI_RATE_LIMITS")
+    if override:
+        try:
+            for model, limit in json.loads(override).items():
+                limits[model] = {"rpm": float(limit["rpm"]), "tpm": float(limit["tpm"])}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            print("❌ Ignoring invalid OPENAI_RATE_LIMITS:", str(e))
+    return limits
+
+
+class TokenBucket:
+    """Refills at `per_minute` units per minute up to `burst_seconds` worth of capacity.
+
+    `reserve` may take the level below zero: that is capacity promised to a
+    waiting caller, so later callers queue behind it in arrival order.
+    """
+
+    def __init__(self, per_minute, burst_seconds=ADMISSION_BURST_SECONDS, now=None):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount):
+        """Seconds until `amount` is available (0 if it is available now)."""
+        needed = min(amount, self.capacity) - self.level
+        return max(0.0, needed / self.rate)
+
+    def reserve(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def drain(self):
+        self.level = min(self.level, 0.0)
+
+
+class AdmissionController:
+    """RPM/TPM admission control in front of one model's OpenAI calls.
+
+    A call reserves one request and its estimated tokens from two token
+    buckets, sleeping until its reservation comes due. It is shed with
+    `Busy` when the queue of sleeping callers is full or the wait would
+    exceed the deadline. 429s from OpenAI drain the buckets and are retried
+    with jittered exponential backoff while the deadline allows; after that
+    the request is shed as `Busy` rather than answered with a fallback.
+    `clock` and `sleep` default to time.monotonic and time.sleep.
+    """
+
+    def __init__(self, model, rpm, tpm, max_queue=ADMISSION_MAX_QUEUE,
+                 max_wait_seconds=ADMISSION_MAX_WAIT_SECONDS, max_retries=ADMISSION_MAX_RETRIES,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.model = model
+        self.clock = clock
+        self.sleep = sleep
+        self.requests = TokenBucket(rpm, now=clock())
+        self.tokens = TokenBucket(tpm, now=clock())
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.max_retries = max_retries
+        self.waiting = 0
+        self.stats = {"admitted": 0, "shed": 0, "rate_limited": 0}
+        self._lock = threading.Lock()
+
+    def _admit(self, tokens, deadline):
+        with self._lock:
+            now = self.clock()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            wait = max(self.requests.wait_for(1), self.tokens.wait_for(tokens))
+
+            if wait > 0 and self.waiting >= self.max_queue:
+                self._shed("queue_full", wait)
+            if now + wait > deadline:
+                self._shed("deadline", wait)
+
+            self.requests.reserve(1)
+            self.tokens.reserve(tokens)
+            self.stats["admitted"] += 1
+            if wait > 0:
+                self.waiting += 1
+                metrics.ADMISSION_QUEUE_DEPTH.labels(self.model).inc()
+
+        if wait > 0:
+            try:
+                self.sleep(wait)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+                metrics.ADMISSION_QUEUE_DEPTH.labels(self.model).dec()
+        metrics.ADMISSION_WAIT_SECONDS.labels(self.model).observe(wait)
+
+    def _shed(self, reason, retry_after):
+        self.stats["shed"] += 1
+        metrics.ADMISSION_SHED.labels(self.model, reason).inc()
+        raise Busy(reason, retry_after)
+
+    def call(self, fn, tokens, max_wait_seconds=None):
+        """Run fn() once admitted for `tokens` tokens; raise Busy if it cannot be admitted in time."""
+        deadline = self.clock() + (self.max_wait_seconds if max_wait_seconds is None else max_wait_seconds)
+        for attempt in range(self.max_retries + 1):
+            self._admit(tokens, deadline)
+            try:
+                return fn()
+            except openai.error.RateLimitError:
+                with self._lock:
+                    self.stats["rate_limited"] += 1
+                    self.requests.drain()
+                    self.tokens.drain()
+                metrics.ADMISSION_RATE_LIMITED.labels(self.model).inc()
+                delay = min(8, 0.5 * 2 ** attempt) * (0.5 + random.random())
+                if attempt == self.max_retries or self.clock() + delay > deadline:
+                    with self._lock:
+                        self._shed("rate_limited", delay)
+                print(f"⏳ OpenAI 429 for {self.model}; retrying in {delay:.1f}s")
+                self.sleep(delay)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "waiting": self.waiting,
+                "rpm_available": round(self.requests.level, 2),
+                "tpm_available": round(self.tokens.level, 2)
+            }
+
+
+class Admission:
+    """One AdmissionController per model, created on first use."""
+
+    def __init__(self, limits=None, worker_share=WORKER_SHARE):
+        self.limits = limits if limits is not None else load_rate_limits()
+        self.worker_share = worker_share
+        self.controllers = {}
+        self._lock = threading.Lock()
+
+    def for_model(self, model):
+        with self._lock:
+            if model not in self.controllers:
+                limit = self.limits.get(model, self.limits["gpt-4"])
+                self.controllers[model] = AdmissionController(
+                    model, limit["rpm"] / self.worker_share, limit["tpm"] / self.worker_share
+                )
+            return self.controllers[model]
+
+    def call(self, model, fn, prompt_tokens, max_wait_seconds=None):
+        tokens = prompt_tokens + ADMISSION_OUTPUT_TOKEN_ESTIMATE
+        return self.for_model(model).call(fn, tokens, max_wait_seconds)
+
+    def snapshot(self):
+        with self._lock:
+            controllers = dict(self.controllers)
+        return {model: controller.snapshot() for model, controller in controllers.items()}
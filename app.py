@@ -1,69 +1,92 @@
 import os
 import json
-import re
+import copy
+import contextlib
+import functools
+import time
 import traceback
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-import openai
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-import tiktoken
+from catalog import CatalogIndex, CATALOG_MATCH_THRESHOLD, catalog_solution
+from response_cache import ResponseCache
+from sheets_logger import SheetsLogger
+from structured_output import IncrementalJSONObject, validate_solution, repair_prompt, raw_fragments, STANDARD_DISCLAIMER
+from token_accounting import TokenAccountant, count_tokens
+from prompts import PromptAssembler
+from singleflight import SingleFlight, SINGLEFLIGHT_WAIT_SECONDS
+from batch import parse_messages, run_batch, BatchSummary, BATCH_CONCURRENCY, BATCH_MAX_MESSAGES
+from admission import Admission, Busy, ADMISSION_MAX_WAIT_SECONDS
+from routing import ModelRouter, LatencyBudgetExceeded, MODEL_CHAIN, LATENCY_BUDGET_SECONDS
+from clients import (
+    configure_openai, sheets_client, chat_completion,
+    OPENAI_REQUEST_TIMEOUT, OPENAI_CONNECT_TIMEOUT_SECONDS, OPENAI_READ_TIMEOUT_SECONDS
+)
+from timing import stage, server_timing_header
+from warmup import Lazy, WarmUp
+import metrics
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "https://cliniconex.com"}})
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+configure_openai(os.getenv("OPENAI_API_KEY"))
 PORT = int(os.getenv("PORT", 10000))
 SHEET_ID = "1jL-iyQiVcttmEMfy7j8DA-cyMM-5bcj1TLHLrb4Iwsg"
 SERVICE_ACCOUNT_FILE = "service_account.json"
+TIMING_LOGS = os.getenv("TIMING_LOGS", "false").lower() == "true"
+
+if os.getenv("FAKE_BACKENDS", "false").lower() == "true":
+    from fakes import install_fake_backends
+    install_fake_backends()
 
-credentials = service_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE, scopes=["https://www.googleapis.com/auth/spreadsheets"]
+# Built on first use (or during warm-up), so a slow or unreachable Google never blocks start-up.
+sheet = Lazy("sheets_client", lambda: sheets_client(SERVICE_ACCOUNT_FILE))
+sheets_logger = SheetsLogger(
+    sheet.get, SHEET_ID, "Advisor Logs!A1",
+    on_error=lambda e: metrics.observe_upstream_error("sheets", e)
 )
-sheet = build("sheets", "v4", credentials=credentials).spreadsheets()
 
-def count_tokens(text, model="gpt-4"):
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        encoding = tiktoken.get_encoding("cl100k_base")
-    return len(encoding.encode(text))
+def load_catalog_index():
+    index = CatalogIndex.from_file()
+    print(f"📚 Loaded catalog index with {len(index.phrases)} phrases")
+    return index
 
-def extract_json(text):
-    try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        match = re.search(r'{.*}', text, re.DOTALL)
-        return json.loads(match.group(0)) if match else None
+catalog_index = Lazy("catalog_index", load_catalog_index)
 
-def log_to_google_sheets(prompt, page_url, product, module, status, matched_issue, matched_solution, full_solution=None, token_count=None, token_cost=None):
+response_cache = ResponseCache()
+token_accountant = TokenAccountant()
+prompt_assembler = PromptAssembler()
+# Waiters get as long as the leader itself can take (its latency budget), plus a little slack.
+gpt_flights = SingleFlight(wait_seconds=SINGLEFLIGHT_WAIT_SECONDS or LATENCY_BUDGET_SECONDS + 5)
+admission = Admission()
+
+def log_to_google_sheets(prompt, page_url, product, module, status, matched_issue, matched_solution, full_solution=None, token_count=None, token_cost=None, model=None, route=None, rows=None):
+    """Queue a log row for the background writer, or append it to `rows` for a caller that bulk-writes."""
     try:
         timestamp = datetime.now(ZoneInfo("America/Toronto")).strftime("%Y-%m-%d %H:%M:%S")
         module_str = ', '.join(module) if isinstance(module, list) else module
         formatted_solution = f"Recommended Product: {product}\n\nModules: {module_str}\n\nHow it works: {matched_solution}"
 
 
-        values = [[
+        row = [
             timestamp, prompt, product, module_str, status,
             matched_issue, matched_solution, page_url,
             "N/A", formatted_solution,
-            token_count or "N/A", token_cost or "N/A"
-        ]]
-
-        sheet.values().append(
-            spreadsheetId=SHEET_ID,
-            range="Advisor Logs!A1",
-            valueInputOption="RAW",
-            body={"values": values}
-        ).execute()
+            token_count or "N/A", token_cost or "N/A",
+            model or "N/A", route or "N/A"
+        ]
+        if rows is not None:
+            rows.append(row)
+        else:
+            sheets_logger.enqueue(row)
 
     except Exception as e:
-        print("❌ Error logging to Google Sheets:", str(e))
+        print("❌ Error queueing Google Sheets log:", str(e))
         traceback.print_exc()
 
-def generate_gpt_solution(message):
+def unsupported_solution(message):
     unsupported_terms = [
         "fax triage", "fax management", "referral processing", "document routing",
         "inbound fax", "ai scribe", "clinical scribe", "note transcription",
@@ -72,6 +95,7 @@ def generate_gpt_solution(message):
     ]
 
     if any(term in message.lower() for term in unsupported_terms):
+        metrics.UNSUPPORTED_TERMS.inc()
         return {
             "product": "No Cliniconex Solution",
             "module": [],
@@ -79,245 +103,573 @@ def generate_gpt_solution(message):
             "benefits": ["Not applicable"],
             "roi": "Not applicable",
             "disclaimer": "Not applicable",
-            "full_solution": "No solution generated due to unsupported request."
+            "full_solution": "No solution generated due to unsupported request.",
+            "status": "unsupported"
         }
+    return None
+
+def build_gpt_prompt(message):
+    """Return (prompt, instruction_names): the core prompt plus the instructions the message triggers."""
+    gpt_prompt, instruction_names = prompt_assembler.assemble(message)
+    for name in instruction_names:
+        metrics.PROMPT_INSTRUCTIONS.labels(name).inc()
+    return gpt_prompt, instruction_names
+
+def count_prompt_tokens(message, instruction_names, model="gpt-4"):
+    # Template and instruction blocks are encoded once; per request only the message is encoded.
+    core = prompt_assembler.template.format(message="", instructions="")
+    return (
+        token_accountant.static_tokens("gpt_prompt", core, model)
+        + sum(token_accountant.static_tokens(name, prompt_assembler.blocks[name], model) for name in instruction_names)
+        + count_tokens(message, model)
+    )
+
+REPAIR_MAX_TOKENS = int(os.getenv("REPAIR_MAX_TOKENS", 400))
+
+def has_json_fields(raw_output):
+    """Whether a completion has enough structure to validate (and repair if needed)."""
+    return bool(IncrementalJSONObject.parse(raw_output).fields)
+
+def budgeted_timeouts(remaining_seconds):
+    """(request_timeout, max_wait_seconds) for an OpenAI call that has remaining_seconds left."""
+    read_timeout = max(1.0, min(OPENAI_READ_TIMEOUT_SECONDS, remaining_seconds))
+    return (OPENAI_CONNECT_TIMEOUT_SECONDS, read_timeout), max(0.0, min(ADMISSION_MAX_WAIT_SECONDS, remaining_seconds))
+
+def repair_solution(parsed, problems, solution, model, deadline=None, message=None):
+    """Re-ask GPT for just the invalid fields, in one small call.
+
+    Returns (solution, problems, input_tokens, output_tokens) after merging
+    the repaired fields back in and validating again. With a `deadline`
+    (time.monotonic()) the call gets only the time left before it, and is
+    skipped when less than a second remains.
+    """
+    request_timeout, max_wait_seconds = OPENAI_REQUEST_TIMEOUT, None
+    if deadline is not None:
+        remaining_seconds = deadline - time.monotonic()
+        if remaining_seconds < 1.0:
+            print("⏱️ No latency budget left to repair GPT output fields:", ", ".join(problems))
+            metrics.OUTPUT_REPAIRS.labels("skipped").inc()
+            return solution, problems, 0, 0
+        request_timeout, max_wait_seconds = budgeted_timeouts(remaining_seconds)
+
+    prompt = repair_prompt(problems, raw_fragments(parsed), solution, message)
+    input_token_count = count_tokens(prompt, model)
+    print(f"🩹 Repairing GPT output fields: {', '.join(problems)}")
+    try:
+        response = admission.call(model, lambda: chat_completion(
+            model=model,
+            messages=[{"role": "system", "content": prompt}],
+            temperature=0,
+            max_tokens=REPAIR_MAX_TOKENS,
+            request_timeout=request_timeout
+        ), input_token_count, max_wait_seconds=max_wait_seconds)
+        raw_repair = response['choices'][0]['message']['content']
+    except Exception as e:
+        # Busy included: the original completion is already paid for, so fall through rather than shed.
+        print("❌ GPT repair error:", str(e))
+        metrics.OUTPUT_REPAIRS.labels("error").inc()
+        return solution, problems, input_token_count, 0
+
+    repaired = IncrementalJSONObject.parse(raw_repair).fields
+    fields = {**parsed.fields, **{field: repaired[field] for field in problems if field in repaired}}
+    solution, problems = validate_solution(fields)
+    metrics.OUTPUT_REPAIRS.labels("failed" if problems else "repaired").inc()
+    return solution, problems, input_token_count, count_tokens(raw_repair, model)
+
+class InvalidSolution(ValueError):
+    """A completion that could not be turned into a solution, with the tokens spent on it and its repair."""
+
+    def __init__(self, reason, model, input_tokens, output_tokens):
+        super().__init__(reason)
+        self.model = model
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+def parse_gpt_output(raw_output, input_token_count, model="gpt-4", parsed=None, deadline=None, message=None):
+    """Validate a completion against the solution schema and shape it as a solution.
+
+    `parsed` is the IncrementalJSONObject the completion was streamed into,
+    if any. Fields that fail validation get one repair call, made before
+    `deadline` if given and told the user's `message` if a text field has to
+    be written from scratch; InvalidSolution is raised if the completion has
+    no JSON object or the repair does not fix it.
+    """
+    parsed = parsed or IncrementalJSONObject.parse(raw_output)
+    output_token_count = count_tokens(raw_output, model)
+    if not parsed.fields:
+        raise InvalidSolution("Invalid JSON from GPT", model, input_token_count, output_token_count)
+
+    solution, problems = validate_solution(parsed.fields)
+    for field in problems:
+        metrics.OUTPUT_VALIDATION_FAILURES.labels(field).inc()
+    if problems:
+        with stage("repair"):
+            solution, problems, repair_input, repair_output = repair_solution(parsed, problems, solution, model, deadline, message)
+        input_token_count += repair_input
+        output_token_count += repair_output
+    if problems:
+        raise InvalidSolution(f"GPT output failed validation: {problems}", model, input_token_count, output_token_count)
+
+    solution["full_solution"] = raw_output
+    solution["module"] = solution.pop("feature")
+    solution["token_count"] = input_token_count + output_token_count
+    solution["token_cost"] = token_accountant.cost(model, input_token_count, output_token_count)
+    solution["usage"] = {"model": model, "input_tokens": input_token_count, "output_tokens": output_token_count}
+    solution["status"] = "gpt"
+
+    return solution
+
+def fallback_solution(input_token_count, model="gpt-4", output_token_count=0):
+    return {
+        "product": "Automated Care Messaging",
+        "module": ["ACM Messenger"],
+        "how_it_works": "Error.",
+        "benefits": ["Fallback benefit"],
+        "roi": "Fallback ROI",
+        "disclaimer": STANDARD_DISCLAIMER,
+        "token_count": input_token_count + output_token_count,
+        "token_cost": token_accountant.cost(model, input_token_count, output_token_count),
+        "usage": {"model": model, "input_tokens": input_token_count, "output_tokens": output_token_count},
+        "full_solution": "Error",
+        "status": "fallback"
+    }
+
+def unbilled_fallback():
+    """The fallback for a request whose OpenAI spend is already accounted for elsewhere."""
+    solution = fallback_solution(0)
+    solution.pop("usage")
+    return solution
+
+def record_gpt_failure(error):
+    if isinstance(error, ValueError):
+        metrics.JSON_PARSE_FAILURES.inc()
+        metrics.GPT_FALLBACKS.labels("invalid_json").inc()
+    else:
+        metrics.observe_upstream_error("openai", error)
+        metrics.GPT_FALLBACKS.labels("upstream_error").inc()
+
+def record_abandoned_usage(model, raw_output, input_token_count, endpoint="/ai"):
+    """Account for a routed call whose answer went unused: invalid, too late, or beaten by another model."""
+    output_token_count = count_tokens(raw_output, model)
+    cost = token_accountant.record(
+        model=model, input_tokens=input_token_count, output_tokens=output_token_count, endpoint=endpoint
+    )
+    metrics.observe_usage(model, input_token_count, output_token_count, cost)
+
+model_router = ModelRouter(on_abandoned=record_abandoned_usage)
+
+def model_caller(gpt_prompt):
+    """Return call(model, input_tokens, remaining_seconds) for ModelRouter, sending gpt_prompt."""
+    def call(model, input_token_count, remaining_seconds):
+        request_timeout, max_wait_seconds = budgeted_timeouts(remaining_seconds)
+        response = admission.call(model, lambda: chat_completion(
+            model=model,
+            messages=[{"role": "system", "content": gpt_prompt}],
+            temperature=0.3,
+            request_timeout=request_timeout
+        ), input_token_count, max_wait_seconds=max_wait_seconds)
+        return response['choices'][0]['message']['content']
+    return call
+
+def generate_gpt_solution(message, endpoint="/ai"):
+    unsupported = unsupported_solution(message)
+    if unsupported:
+        return unsupported
+
+    with stage("prompt"):
+        gpt_prompt, instruction_names = build_gpt_prompt(message)
+    with stage("tokens"):
+        input_token_count = count_prompt_tokens(message, instruction_names)
+    print(f"🧩 Instructions in GPT prompt: {', '.join(instruction_names)}")
+    print(f"🔢 Token count for GPT prompt: {input_token_count}")
 
-    gpt_prompt = f"""
-    You are a Cliniconex solutions expert with deep expertise in the company’s full suite of products and features. You can confidently assess any healthcare-related issue and determine the most effective solution—whether it involves a single product or a combination of offerings. You understand how each feature functions within the broader Automated Care Platform (ACP) and are skilled at tailoring precise recommendations to address real-world clinical, operational, and administrative challenges.
-
-    Cliniconex offers **Automated Care Platform (ACP)** — a complete system for communication, coordination, and care automation. ACP is composed of two core solutions:
-
-    **Automated Care Messaging (ACM):**
-
-    **ACM Messenger** delivers automated, personalized outreach across voice, text, and email—driven by EMR data. Designed to send timely reminders, instructions, and care updates, ACM Messenger uses dynamic content and configurable workflows to ensure the right information reaches the right person at the right time.
-
-    **ACM Vault** provides secure, encrypted communication for sensitive health information—fully integrated with ACM Messenger. ACM Vault enables healthcare providers to send encrypted messages and documents via **email only**, ensuring HIPAA, PHIPA, and PIPEDA compliance. It is purpose-built to protect patient privacy, reduce risk, and support audit readiness while automating secure communication workflows.
-
-    **ACM Alerts** – Real-time, automated notifications for urgent or time-sensitive updates—delivered via voice, text, or email. ACM Alerts empowers healthcare providers to reach patients, families, and staff instantly with critical messages such as closures, emergencies, or last-minute changes. Fully configurable and EMR-integrated, it ensures rapid, targeted outreach when every second counts.
-
-    **ACM Concierge** – Real-time wait time displays and virtual queuing that keep patients informed and engaged. ACM Concierge integrates with your EMR to publish accurate queue updates on websites, in-clinic screens, or via text. Patients can opt in for return-time notifications, improving satisfaction, reducing front-desk interruptions, and creating a calmer, more efficient waiting experience.
-
-    **Automated Care Scheduling (ACS):**
-
-    **ACS Booking** – Lets patients book their own appointments online, anytime. Integrated with your EMR, it keeps schedules up to date, reduces no-shows, and saves staff time by cutting down on phone calls and manual entry. Simple for patients, easier for your team.
+    # A repair call has to fit in what is left of the routing budget.
+    deadline = time.monotonic() + model_router.budget_seconds
+    try:
+        with stage("openai"):
+            raw_output, model, input_token_count, route = model_router.complete(
+                model_caller(gpt_prompt),
+                lambda model: count_prompt_tokens(message, instruction_names, model),
+                has_json_fields,
+                on_abandoned=functools.partial(record_abandoned_usage, endpoint=endpoint)
+            )
+        with stage("parse"):
+            solution = parse_gpt_output(raw_output, input_token_count, model, deadline=deadline, message=message)
+        solution["model"], solution["route"] = model, route
+
+    except Busy:
+        raise
+    except LatencyBudgetExceeded as e:
+        print("⏱️ GPT fallback:", str(e))
+        metrics.GPT_FALLBACKS.labels("latency_budget").inc()
+        solution = unbilled_fallback()
+    except InvalidSolution as e:
+        # The router returned this completion as the winner, so its spend (and the repair's) is billed here.
+        print("❌ GPT fallback error:", str(e))
+        metrics.GPT_FALLBACKS.labels("invalid_json").inc()
+        solution = fallback_solution(e.input_tokens, e.model, e.output_tokens)
+    except Exception as e:
+        # The router reports every other attempt's spend through record_abandoned_usage; the fallback adds none.
+        print("❌ GPT fallback error:", str(e))
+        metrics.GPT_FALLBACKS.labels("invalid_json" if isinstance(e, ValueError) else "upstream_error").inc()
+        solution = unbilled_fallback()
+
+    solution["instructions"] = instruction_names
+    return solution
+
+def stream_gpt_solution(message):
+    """Yield (event, data) pairs while GPT streams, ending with ("done", solution)."""
+    unsupported = unsupported_solution(message)
+    if unsupported:
+        yield "done", unsupported
+        return
+
+    # Tokens already sent to the client cannot be taken back, so streams use the
+    # primary model only and are never hedged.
+    model = MODEL_CHAIN[0]
+    gpt_prompt, instruction_names = build_gpt_prompt(message)
+    input_token_count = count_prompt_tokens(message, instruction_names, model)
+    print(f"🧩 Instructions in GPT prompt: {', '.join(instruction_names)}")
+    print(f"🔢 Token count for GPT prompt: {input_token_count}")
 
-    **ACS Forms** – Digital forms that collect patient information before the appointment. Fully integrated with your EMR, ACS Forms replaces paper intake with customizable forms patients can complete online. Save time, reduce errors, and make check-ins easier for everyone.
+    try:
+        response = admission.call(model, lambda: chat_completion(
+            model=model,
+            messages=[{"role": "system", "content": gpt_prompt}],
+            temperature=0.3,
+            stream=True,
+            request_timeout=OPENAI_REQUEST_TIMEOUT
+        ), input_token_count)
+        parsed = IncrementalJSONObject()
+        for chunk in response:
+            delta = chunk['choices'][0].get('delta', {}).get('content')
+            if not delta:
+                continue
+            for event, data in parsed.feed(delta):
+                yield event, data
+
+        solution = parse_gpt_output(parsed.raw, input_token_count, model, parsed.finish(), message=message)
+        solution["model"], solution["route"] = model, "primary"
+
+    except Busy:
+        raise
+    except Exception as e:
+        print("❌ GPT stream fallback error:", str(e))
+        record_gpt_failure(e)
+        if isinstance(e, InvalidSolution):
+            solution = fallback_solution(e.input_tokens, e.model, e.output_tokens)
+        else:
+            solution = fallback_solution(input_token_count, model)
 
-    **ACS Surveys** – Automatically sends surveys to patients after visits or key events. Collects feedback, tracks trends, and helps you understand where to improve. Easy to set up, fully integrated with your EMR, and built to support better care through real insights.
+    solution["instructions"] = instruction_names
+    yield "done", solution
 
-    🛑 IMPORTANT: Do not use definite articles (e.g., “the”) in front of product or feature names.
-        ✅ Always refer to product and module names exactly as listed: 
-        - Automated Care Messaging, Automated Care Scheduling
-        - ACM Messenger, ACM Vault, ACM Alerts, ACM Concierge
-        - ACS Booking, ACS Forms, ACS Surveys
-        ❌ Do NOT say: “the ACM Messenger,” “the ACS Forms,” etc.
+def get_cached_solution(message):
+    try:
+        return response_cache.get(message)
+    except Exception as e:
+        print("❌ Response cache read error:", str(e))
+        return None
 
-    🧩 Product Attribution Rule:
-    - Assign "Automated Care Messaging" if all selected features are from ACM modules.
-    - Assign "Automated Care Scheduling" if all selected features are from ACS modules.
-    - Assign both ("Automated Care Messaging, Automated Care Scheduling") if features are drawn from both categories.
-    - Never assign a product unless one of its features is used.
+def cache_solution(message, solution):
+    try:
+        response_cache.set(message, solution)
+    except Exception as e:
+        print("❌ Response cache write error:", str(e))
 
-    Here is a real-world issue described by a healthcare provider:
-    "{message}"
+def generate_coalesced_solution(message, endpoint="/ai"):
+    """Run generate_gpt_solution, sharing one upstream call between identical in-flight messages.
 
-IMPORTANT: Be sure you pay attention to the special instructions below.
+    Returns (solution, status). Requests that reuse another request's call get
+    status "coalesced" and no token spend of their own.
+    """
+    try:
+        with stage("gpt"):
+            solution, shared = gpt_flights.do(response_cache.key(message), lambda: generate_gpt_solution(message, endpoint))
+    except FutureTimeoutError:
+        # The leader is past its own deadline, so OpenAI is struggling; calling it again would only add load.
+        print("⏳ Timed out waiting on an identical in-flight GPT call; using the fallback")
+        metrics.GPT_FALLBACKS.labels("coalesce_timeout").inc()
+        return unbilled_fallback(), "fallback"
+
+    solution = copy.deepcopy(solution)
+    status = solution.get("status", "gpt")
+    if shared:
+        print("🔗 Coalesced with an identical in-flight GPT call")
+        solution["token_count"], solution["token_cost"] = 0, 0
+        solution.pop("usage", None)
+        if status == "gpt":
+            status = "coalesced"
+    return solution, status
+
+def find_local_solution(message):
+    """Return (solution, status, matched_issue) from the catalog or response cache, else None.
+
+    The unsupported-terms check runs first so a catalog match can never
+    override "No Cliniconex Solution".
+    """
+    unsupported = unsupported_solution(message)
+    if unsupported:
+        return unsupported, "unsupported", None
+
+    with stage("catalog"):
+        catalog_match = catalog_index.get().match(message, CATALOG_MATCH_THRESHOLD)
+    if catalog_match:
+        entry, score = catalog_match
+        print(f"📚 Catalog match ({score:.1f}): {entry['issue']}")
+        return catalog_solution(entry), "catalog", entry["issue"]
+
+    with stage("cache"):
+        cached = get_cached_solution(message)
+    if cached:
+        print("⚡ Response cache hit")
+        cached["token_count"], cached["token_cost"] = 0, 0
+        cached.pop("usage", None)
+        cached.pop("route", None)
+        return cached, "cache", None
+
+    return None
+
+def respond_with_solution(message, page_url, gpt_response, status, matched_issue=None, endpoint="/ai", log_rows=None):
+    """Build the widget response for a solution, record its token spend and queue its Sheets log row."""
+    if status == "gpt":
+        with stage("cache"):
+            cache_solution(message, gpt_response)
+
+    gpt_response.pop("status", None)
+    gpt_response.pop("instructions", None)
+    model = gpt_response.pop("model", None)
+    route = gpt_response.pop("route", None)
+    usage = gpt_response.pop("usage", None)
+    if usage:
+        cost = token_accountant.record(endpoint=endpoint, page_url=page_url, **usage)
+        metrics.observe_usage(usage["model"], usage["input_tokens"], usage["output_tokens"], cost)
+    metrics.SOLUTIONS.labels(endpoint, status).inc()
+    token_count = gpt_response.pop("token_count", 0)
+    token_cost = gpt_response.pop("token_cost", 0)
+
+    product = gpt_response.get("product", "N/A")
+    modules = gpt_response.get("module", [])
+    module_str = ', '.join(modules) if isinstance(modules, list) else modules
+    how_it_works = gpt_response.get("how_it_works", "N/A")
+
+    full_solution = f"Recommended Product: {product}\n\nModules: {module_str}\n\nHow it works: {how_it_works}"
+
+    response = {
+        "type": "solution",
+        "product": product,
+        "module": module_str or "N/A",
+        "solution": how_it_works or "N/A",
+        "benefits": "\n".join(gpt_response.get("benefits", [])) or "N/A",
+        "roi": gpt_response.get("roi", "N/A"),
+        "disclaimer": gpt_response.get("disclaimer", "")
+    }
+
+    with stage("log"):
+        log_to_google_sheets(message, page_url, product, modules, status, matched_issue or product, how_it_works, full_solution, token_count, token_cost, model, route, log_rows)
+    return response
+
+@app.before_request
+def note_first_request():
+    if request.path != "/ready":
+        warm_up.mark_request()
+
+@app.after_request
+def add_server_timing(response):
+    timings = server_timing_header()
+    if timings:
+        response.headers["Server-Timing"] = timings
+        if TIMING_LOGS:
+            print(json.dumps({
+                "event": "request_timing",
+                "path": request.path,
+                "status": response.status_code,
+                "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in g.stage_timings.items()}
+            }))
+    return response
 
-### 🧠 Special Instructions for Accurate Feature Selection and Solution Formation:
+@app.route("/ai", methods=["POST"])
+def get_solution():
+    print("🔔 🔔🔔 /ai called with payload:", request.get_json())
+    try:
+        with stage("total"):
+            data = request.get_json()
+            message = data.get("message", "").lower()
+            page_url = data.get("page_url", "")
+
+            local = find_local_solution(message)
+            if local:
+                gpt_response, status, matched_issue = local
+            else:
+                gpt_response, status = generate_coalesced_solution(message)
+                matched_issue = None
+
+            return jsonify(respond_with_solution(message, page_url, gpt_response, status, matched_issue))
+
+    except Busy as e:
+        print("🚦 Shedding /ai request:", str(e))
+        return busy_response(e)
+    except Exception as e:
+        print("❌ Error:", str(e))
+        return jsonify({"error": "An error occurred."}), 500
 
-1. **ACM Vault Usage Rule**  
-   - ACM Vault is **not a standalone messaging tool**.  
-   - It is a **secure extension of ACM Messenger** used for encrypted communications via email.  
-   - **Always include ACM Messenger** when recommending ACM Vault. Never present Vault in isolation.
-
-2. **Handling No-Shows or Missed Appointments**  
-   - If the input refers to “no shows,” “missed appointments,” or “missed visits,” recommend **ACM Alerts** for same-day, real-time reminders.  
-   - Recommend **ACM Messenger** only when the issue involves **routine appointment reminders** sent **days in advance**.
-
-3. **Family Portals and Login Requests**  
-   - Cliniconex **does not offer a dedicated login portal** for families.  
-   - Instead, emphasize that **ACM Messenger** and **ACM Vault** provide **secure, automated updates** to family members via voice, text, or email—without requiring logins or portals.
-
-4. **High Manual Workload or Need for Automation**  
-   - If the input involves operational inefficiencies, communication bottlenecks, or staff burden from repetitive tasks (e.g., calling patients), prioritize **ACM Alerts**.  
-   - Use **ACM Messenger** only for predictable, advance-scheduled outreach.
-
-5. **Message Creation, Optimization, or Staff Support with Communication**  
-   - Recommend the **AI Message Assistant** only when the task involves **creating or refining** healthcare messages.  
-   - Clearly state it is a feature within **ACM Messenger**, helping staff write effective messages quickly.  
-   - Do not force AI into solutions unless explicitly relevant.
-
-6. **Patient Confusion or Unpreparedness Before Appointments**  
-   - If the issue is patients arriving unprepared or confused:  
-     - Recommend **ACS Forms** for collecting information beforehand.  
-     - Recommend **ACM Alerts** for just-in-time, real-time instructions close to the appointment.  
-     - Use **ACM Messenger** only for well-in-advance scheduled communication.
-
-7. **EMR/EHR Integration and Workflow Compatibility**  
-   - Cliniconex integrates **directly with major EMR/EHR systems** to enable real-time, automated communication.  
-   - Highlight **zero-disruption implementation** and **no need for middleware or portals**.  
-   - Emphasize that communications are **driven by live clinical data**—not manual input.
-
-8. **Clarifying ACM Alerts Use Cases**  
-   - ACM Alerts is for **event-triggered, dynamic messaging**—ideal for same-day updates, urgent changes, or appointment confirmations.  
-   - Use it for:
-     - Last-minute changes (e.g., provider cancellations, new availability)
-     - Timely reminders (e.g., “arrive 15 min early,” “don’t forget fasting”)
-     - Waitlist offers or urgent campaigns  
-   - Do **not** recommend ACM Alerts for:
-     - Routine reminders sent days in advance
-     - Static workflows (use ACM Messenger instead)
-
- 9. Check-in Capability:
-    - Patients **cannot check in from home** using ACS Forms alone.
-    - ACS Forms supports **intake**, not actual appointment check-in.
-    - Recommend ACS Booking only if “remote check-in” implies full online appointment workflows.
-
-10. Reminder Communication Rule:
-    - If the input includes “automated reminders,” “custom reminders,” “real-time alerts,” or “same-day updates,” prioritize ACM Alerts.
-    - ACS Forms supports **intake**, not actual appointment check-in.
-    - Use ACM Messenger only if the context clearly describes reminders sent well in advance of the appointment (e.g., routine scheduling).                
-
-11. Two-Way Messaging Capability
-    - ACM Messenger supports two-way messaging only when configured with the Text Response Message Type.
-    - Two-way responses are supported via voice, text, and email — depending on the patient’s original communication channel.
-    - Do not imply that all ACM Messenger messages allow replies.
-
-12. Audience Filtering and Targeted Communication
-    - All ACM modules (Messenger, Alerts, Vault) support audience filtering based on EMR data such as: Resident or patient location (e.g., floor, unit, clinic), Appointment type or provider, Visit status or scheduling logic
-    - If the challenge involves notifying specific groups (e.g., only 2nd floor residents, flu shot recipients, patients of a specific provider), emphasize that Cliniconex can target communications precisely to avoid sending irrelevant or broad messages.
-    - This filtering is essential to reducing message fatigue, ensuring compliance, and improving engagement.
-
-                 
-
-Clarify this is an optional, configurable feature for interactive outreach.
-Your response must include:
-1. product
-2. Module
-3. how_it_works (1 paragraph)
-4. benefits (2-3 concise bullet points)
-5. roi (quantified, realistic)
-6. disclaimer (standardized)
-
-Your job is to:
-
-1. **Determine the best product(s)**: Choose between Automated Care Messaging, Automated Care Scheduling, or both.
-2. **Select features** from the list below that best solve the issue. Include all relevant features but avoid unnecessary ones.
-3. **Explain how the solution works** in one clear paragraph—connect the feature to the provider's challenge and show how it fits in ACP.
-4. **List 2–3 operational benefits** tailored to the problem. Avoid repeating phrases from other solutions.
-5. **Estimate ROI** tailored to the input:
-- Focus on quantifiable gains: fewer calls, reduced no-shows, saved staff hours, increased patient throughput.
-- Anchor estimates to the specific issue described.
-- Keep numbers conservative and realistic (e.g., 10–25% efficiency gains).
-- Vary the format to avoid repetition. Use hours/year, % improvement, $ saved, or reduced manual workload.
-
-🛑 IMPORTANT: Do not use definite articles (“the”) before feature or product names.
-
-🧩 Product Attribution Rule:
-- Use "Automated Care Messaging" if all features are from ACM modules.
-- Use "Automated Care Scheduling" if all features are from ACS modules.
-- Use both if applicable.
-
-Respond ONLY in this exact JSON format:
-
-{{
-"product": "Automated Care Messaging",
-"feature": ["ACM Alerts", "ACS Forms"],
-"how_it_works": "One paragraph tailored to the problem.",
-"benefits": [
-"Tailored benefit based on input.",
-"Another tailored operational gain.",
-"Optional third, if useful."
-],
-"roi": "Anchored to the specific challenge, e.g., Saves 250 hours/year by reducing phone calls for patient instructions.",
-"disclaimer": "Note: The ROI estimates provided are based on typical industry benchmarks and assumptions for healthcare settings. Actual ROI may vary depending on clinic size, patient volume, and specific operational factors."
-}}
-
-    Do not include anything outside the JSON block.
-    Focus on solving the issue. Be specific. Avoid generic or repeated phrases. Use real-world healthcare workflow language.
+BUSY_MESSAGE = "We're helping a lot of people right now. Please try again in a moment."
+
+def busy_response(error):
+    response = jsonify({"type": "busy", "error": BUSY_MESSAGE})
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 503
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/ai/stream", methods=["POST"])
+def stream_solution():
+    print("🔔 /ai/stream called with payload:", request.get_json())
+    data = request.get_json() or {}
+    message = data.get("message", "").lower()
+    page_url = data.get("page_url", "")
+
+    def events():
+        try:
+            with stage("stream_total"):
+                local = find_local_solution(message)
+                if local:
+                    gpt_response, status, matched_issue = local
+                else:
+                    matched_issue = None
+                    for event, event_data in stream_gpt_solution(message):
+                        if event == "done":
+                            gpt_response = event_data
+                        else:
+                            yield sse_event(event, event_data)
+                    status = gpt_response.get("status", "gpt")
+
+                yield sse_event("solution", respond_with_solution(message, page_url, gpt_response, status, matched_issue, "/ai/stream"))
+
+        except Busy as e:
+            print("🚦 Shedding /ai/stream request:", str(e))
+            yield sse_event("busy", {"type": "busy", "error": BUSY_MESSAGE, "retry_after": e.retry_after})
+        except Exception as e:
+            print("❌ Stream error:", str(e))
+            yield sse_event("error", {"error": "An error occurred."})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+BATCH_BUSY_RETRIES = int(os.getenv("BATCH_BUSY_RETRIES", 3))
+
+def solve_batch_item(item, fresh, log_rows):
+    """Answer one batch message like /ai does, waiting out Busy instead of failing the item."""
+    message = item["message"].lower()
+    for attempt in range(BATCH_BUSY_RETRIES + 1):
+        try:
+            local = None if fresh else find_local_solution(message)
+            if local:
+                gpt_response, status, matched_issue = local
+            else:
+                gpt_response, status = generate_coalesced_solution(message, "/ai/batch")
+                matched_issue = None
+            response = respond_with_solution(
+                message, item["page_url"], gpt_response, status, matched_issue, "/ai/batch", log_rows
+            )
+            return {**response, "status": status}
+        except Busy as e:
+            if attempt == BATCH_BUSY_RETRIES:
+                raise
+            time.sleep(e.retry_after)
+
+def batch_results(items, concurrency=BATCH_CONCURRENCY, fresh=False):
+    """Yield a result per item as it finishes, then a summary.
+
+    Sheets rows go out in one append at the end, or when the consumer stops
+    early, for every item answered so far.
     """
-    input_token_count = count_tokens(gpt_prompt)
-    print(f"🔢 Token count for GPT prompt: {input_token_count}")
-
+    log_rows = []
+    summary = BatchSummary()
+    results = run_batch(items, lambda item: solve_batch_item(item, fresh, log_rows), concurrency)
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[{"role": "system", "content": gpt_prompt}],
-            temperature=0.3
-        )
-        raw_output = response['choices'][0]['message']['content']
-        parsed = extract_json(raw_output)
+        with contextlib.closing(results):
+            for result in results:
+                summary.add(result)
+                yield result
+    finally:
+        if log_rows:
+            with stage("log"):
+                sheets_logger.enqueue_batch(log_rows)
+    yield summary.snapshot()
+
+@app.route("/ai/batch", methods=["POST"])
+def batch_solutions():
+    """Run many messages through /ai's pipeline; results stream back as JSONL, ending with a summary line."""
+    data = request.get_json(silent=True)
+    options = data if isinstance(data, dict) else request.args
+    try:
+        items = parse_messages(request.get_data(as_text=True))
+    except Exception as e:
+        print("❌ Could not read /ai/batch messages:", str(e))
+        return jsonify({"error": "Could not read the messages."}), 400
+    if not items:
+        return jsonify({"error": "No messages given."}), 400
+    if len(items) > BATCH_MAX_MESSAGES:
+        return jsonify({"error": f"At most {BATCH_MAX_MESSAGES} messages per batch."}), 400
 
-        if not parsed:
-            raise ValueError("Invalid JSON from GPT")
+    try:
+        concurrency = int(options.get("concurrency", BATCH_CONCURRENCY))
+    except (TypeError, ValueError):
+        concurrency = BATCH_CONCURRENCY
+    fresh = str(options.get("fresh", "false")).lower() == "true"
+    print(f"📦 /ai/batch called with {len(items)} message(s), concurrency {concurrency}, fresh={fresh}")
 
-        if "roi" not in parsed:
-            parsed["roi"] = "Estimated ROI placeholder."
-        if "disclaimer" not in parsed:
-            parsed["disclaimer"] = "Standard disclaimer."
+    def lines():
+        with contextlib.closing(batch_results(items, concurrency, fresh)) as results:
+            for result in results:
+                yield json.dumps(result) + "\n"
 
-        parsed["full_solution"] = raw_output
-        parsed["module"] = parsed.pop("feature", [])
+    return Response(stream_with_context(lines()), mimetype="application/x-ndjson")
 
-        output_token_count = count_tokens(raw_output)
-        total_token_count = input_token_count + output_token_count
-        token_cost_usd = round((total_token_count / 1000) * 0.03, 5)
+@app.route("/ai/cache", methods=["GET"])
+def get_cache_stats():
+    try:
+        return jsonify({**response_cache.stats(), "singleflight": gpt_flights.snapshot()})
+    except Exception as e:
+        print("❌ Response cache stats error:", str(e))
+        return jsonify({"error": "An error occurred."}), 500
 
-        parsed["token_count"] = total_token_count
-        parsed["token_cost"] = token_cost_usd
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
 
-        return parsed
+@app.route("/ai/usage", methods=["GET"])
+def get_token_usage():
+    return jsonify({**token_accountant.snapshot(), "instructions": prompt_assembler.snapshot()})
 
-    except Exception as e:
-        print("❌ GPT fallback error:", str(e))
-        return {
-            "product": "Automated Care Messaging",
-            "module": ["ACM Messenger"],
-            "how_it_works": "Error.",
-            "benefits": ["Fallback benefit"],
-            "roi": "Fallback ROI",
-            "disclaimer": "Standard disclaimer.",
-            "token_count": input_token_count,
-            "token_cost": round((input_token_count / 1000) * 0.03, 5),
-            "full_solution": "Error"
-        }
+@app.route("/ai/admission", methods=["GET"])
+def get_admission_stats():
+    return jsonify(admission.snapshot())
 
-@app.route("/ai", methods=["POST"])
-def get_solution():
-    print("🔔 🔔🔔 /ai called with payload:", request.get_json())
-    try:
-        data = request.get_json()
-        message = data.get("message", "").lower()
-        page_url = data.get("page_url", "")
-
-        gpt_response = generate_gpt_solution(message)
-        token_count = gpt_response.pop("token_count", 0)
-        token_cost = gpt_response.pop("token_cost", 0)
-
-        product = gpt_response.get("product", "N/A")
-        modules = gpt_response.get("module", [])
-        module_str = ', '.join(modules) if isinstance(modules, list) else modules
-        how_it_works = gpt_response.get("how_it_works", "N/A")
-
-        full_solution = f"Recommended Product: {product}\n\nModules: {module_str}\n\nHow it works: {how_it_works}"
-
-        response = {
-            "type": "solution",
-            "product": product,
-            "module": module_str or "N/A",
-            "solution": how_it_works or "N/A",
-            "benefits": "\n".join(gpt_response.get("benefits", [])) or "N/A",
-            "roi": gpt_response.get("roi", "N/A"),
-            "disclaimer": gpt_response.get("disclaimer", "")
-        }
+@app.route("/ready", methods=["GET"])
+def get_readiness():
+    status = warm_up.status()
+    return jsonify(status), 200 if status["ready"] else 503
 
-        log_to_google_sheets(message, page_url, product, modules, "gpt", product, how_it_works, full_solution, token_count, token_cost)
-        return jsonify(response)
+def warm_prompt_tokens():
+    # Loads the tiktoken encoding and caches the token count of the template and every instruction block.
+    count_prompt_tokens("", prompt_assembler.order)
+    print(f"🔢 Static GPT prompt tokens: {count_prompt_tokens('', prompt_assembler.core)}")
 
-    except Exception as e:
-        print("❌ Error:", str(e))
-        return jsonify({"error": "An error occurred."}), 500
+warm_up = WarmUp([
+    ("catalog_index", catalog_index.get, True),
+    ("prompt_tokens", warm_prompt_tokens, True),
+    ("response_cache", response_cache.stats, False),
+    ("sheets_client", sheet.get, False)
+])
 
 if __name__ == "__main__":
     print(f"✅ Starting Cliniconex AI widget on port {PORT}")
+    warm_up.start_background()
     app.run(host="0.0.0.0", port=PORT)
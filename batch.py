@@ -0,0 +1,252 @@
+# batch.py
+"""Bulk evaluation of many messages through the /ai pipeline.
+
+Messages run concurrently on a bounded pool, under the same admission
+control as live traffic, and results come back as JSONL in completion
+order followed by a summary line. The run's Sheets log rows are written
+in a single bulk append at the end, including when the run is cut short.
+
+    python batch.py questions.jsonl --concurrency 8 --output results.jsonl
+    python batch.py --corpus gpt --fresh
+    python batch.py questions.txt --url http://localhost:10000
+
+Input may be a JSON list, a JSON object with a "messages" list, JSONL, or
+plain text with one message per line. Each message is a string or an
+object with "message" and optional "page_url". --fresh skips the catalog
+and response cache so every message is answered by GPT, which is what you
+want when evaluating a prompt change.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from admission import Busy
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 32))
+BATCH_MAX_MESSAGES = int(os.getenv("BATCH_MAX_MESSAGES", 2000))
+BATCH_PAGE_URL = "batch"
+# Messages submitted ahead of the consumer, per pool thread.
+BATCH_WINDOW_FACTOR = 2
+
+
+def message_text(value):
+    """A message as text: strings as given, numbers as written, anything else (null, lists, objects) as ""."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return ""
+
+
+def parse_messages(text):
+    """Return [{"message", "page_url"}] from a JSON list/object, JSONL or plain-text body.
+
+    Entries with no usable message text are skipped.
+    """
+    text = text.strip()
+    if not text:
+        return []
+    try:
+        data = json.loads(text)
+        lines = data.get("messages", []) if isinstance(data, dict) else data
+        if not isinstance(lines, list):
+            lines = [lines]
+    except json.JSONDecodeError:
+        lines = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                lines.append(json.loads(line))
+            except json.JSONDecodeError:
+                lines.append(line)
+
+    items = []
+    for line in lines:
+        if isinstance(line, dict):
+            message, page_url = message_text(line.get("message")), line.get("page_url")
+            if not isinstance(page_url, str) or not page_url.strip():
+                page_url = BATCH_PAGE_URL
+        else:
+            message, page_url = message_text(line), BATCH_PAGE_URL
+        if message.strip():
+            items.append({"message": message, "page_url": page_url})
+    return items
+
+
+def run_batch(items, solve, concurrency=BATCH_CONCURRENCY):
+    """Run solve(item) for every item on a bounded pool, yielding results as they finish.
+
+    Each result is solve's dict plus "index" and "message". A request shed
+    as busy or raising an error yields a result of type "busy" or "error"
+    instead of stopping the batch. Only a window of items is submitted
+    ahead of the consumer; closing the generator (e.g. when a client
+    disconnects) cancels everything not yet started and waits only for the
+    calls already in flight.
+    """
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    queued = iter(enumerate(items))
+    futures = {}
+
+    def submit_next():
+        for index, item in queued:
+            futures[pool.submit(solve, item)] = index
+            return
+
+    try:
+        for _ in range(concurrency * BATCH_WINDOW_FACTOR):
+            submit_next()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures.pop(future)
+                submit_next()
+                result = {"index": index, "message": items[index]["message"]}
+                try:
+                    result.update(future.result())
+                except Busy as e:
+                    result.update({"type": "busy", "error": str(e)})
+                except Exception as e:
+                    result.update({"type": "error", "error": str(e)})
+                yield result
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+class BatchSummary:
+    """Throughput, failures and product/module distribution for a batch run."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.failures = 0
+        self.types = Counter()
+        self.statuses = Counter()
+        self.products = Counter()
+        self.modules = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, result):
+        with self._lock:
+            self.requests += 1
+            self.types[result.get("type", "error")] += 1
+            if result.get("type") != "solution":
+                self.failures += 1
+                return
+            self.statuses[result.get("status", "gpt")] += 1
+            self.products[result.get("product", "N/A")] += 1
+            for module in str(result.get("module", "")).split(","):
+                if module.strip():
+                    self.modules[module.strip()] += 1
+
+    def snapshot(self):
+        with self._lock:
+            seconds = time.perf_counter() - self.started
+            return {
+                "type": "summary",
+                "requests": self.requests,
+                "failures": self.failures,
+                "seconds": round(seconds, 2),
+                "requests_per_second": round(self.requests / seconds, 2) if seconds else 0.0,
+                "types": dict(self.types),
+                "statuses": dict(self.statuses),
+                "products": dict(self.products.most_common()),
+                "modules": dict(self.modules.most_common())
+            }
+
+
+def print_summary(summary, out=sys.stderr):
+    print(f"\n{summary['requests']} request(s) in {summary['seconds']}s "
+          f"({summary['requests_per_second']} req/s), {summary['failures']} failure(s)", file=out)
+    for title, key in (("Outcome", "types"), ("Status", "statuses"), ("Product", "products"), ("Module", "modules")):
+        counts = summary.get(key) or {}
+        if not counts:
+            continue
+        print(f"\n  {title:<56} {'count':>6} {'share':>7}", file=out)
+        total = sum(counts.values())
+        for name, count in sorted(counts.items(), key=lambda item: -item[1]):
+            print(f"  {name[:56]:<56} {count:>6} {count / total:>7.1%}", file=out)
+
+
+def local_results(items, concurrency, fresh):
+    import app
+    app.warm_up.run()
+    try:
+        yield from app.batch_results(items, concurrency, fresh)
+    finally:
+        # The Sheets writer is a daemon thread; let it finish the run's append before the process exits.
+        app.sheets_logger.flush()
+
+
+def remote_results(url, items, concurrency, fresh):
+    import requests
+    response = requests.post(
+        url.rstrip("/") + "/ai/batch",
+        json={"messages": items, "concurrency": concurrency, "fresh": fresh},
+        stream=True, timeout=(10, 600)
+    )
+    response.raise_for_status()
+    for line in response.iter_lines(decode_unicode=True):
+        if line:
+            yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run many messages through the /ai pipeline and summarize the answers.")
+    parser.add_argument("input", nargs="?", help="JSON, JSONL or text file of messages ('-' for stdin)")
+    parser.add_argument("--corpus", choices=["mixed", "catalog", "gpt"],
+                        help="use messages built from cliniconex_solutions.json instead of an input file")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--fresh", action="store_true", help="skip the catalog and response cache; always ask GPT")
+    parser.add_argument("--url", help="send the batch to a running server's /ai/batch instead of running in-process")
+    parser.add_argument("--output", help="write JSONL results here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's per-request output")
+    args = parser.parse_args(argv)
+
+    if args.corpus:
+        from loadtest import build_corpus
+        items = [{"message": message, "page_url": BATCH_PAGE_URL} for message in build_corpus(args.corpus)]
+    elif args.input:
+        if args.input == "-":
+            items = parse_messages(sys.stdin.read())
+        else:
+            with open(args.input, encoding="utf-8") as f:
+                items = parse_messages(f.read())
+    else:
+        parser.error("give an input file or --corpus")
+
+    if args.url:
+        results = remote_results(args.url, items, args.concurrency, args.fresh)
+    else:
+        results = local_results(items, args.concurrency, args.fresh)
+
+    summary = None
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    # The app prints as it works; `out` keeps the real stdout if results go there.
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        for result in results:
+            if result.get("type") == "summary":
+                summary = result
+            else:
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+    if out is not sys.stdout:
+        out.close()
+
+    if summary:
+        print_summary(summary)
+    return 1 if not summary or summary["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
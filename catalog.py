@@ -0,0 +1,105 @@
+# catalog.py
+
+import os
+import re
+import json
+from rapidfuzz import fuzz, process, utils
+from response_cache import STOPWORDS
+
+CATALOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cliniconex_solutions.json")
+CATALOG_MATCH_THRESHOLD = float(os.getenv("CATALOG_MATCH_THRESHOLD", 85))
+CATALOG_MIN_SHARED_WORDS = int(os.getenv("CATALOG_MIN_SHARED_WORDS", 2))
+CATALOG_MIN_COVERAGE = float(os.getenv("CATALOG_MIN_COVERAGE", 0.5))
+# The catalog's ROI lines are unfilled templates ("... of **$X/year** ...").
+ROI_PLACEHOLDER = re.compile(r"\$X\b")
+
+
+class CatalogIndex:
+    """In-memory fuzzy index over the curated issues in cliniconex_solutions.json.
+
+    Every entry contributes its `issue` and each of its `keywords` as a
+    candidate phrase. Phrases are normalized once at build time so a lookup
+    only has to normalize the incoming message.
+
+    Phrases are scored with token_set_ratio, so a message that contains a
+    catalog phrase, or is contained in one, scores high whatever the
+    surrounding words. A match must also share CATALOG_MIN_SHARED_WORDS of
+    the issue's own non-stopwords with the message, and at least
+    CATALOG_MIN_COVERAGE of them, so that one common word ("patients") or a
+    generic pair ("patient satisfaction") does not pick a narrow issue. The
+    keywords are the issue wrapped in templates ("how to solve ...",
+    "... in healthcare"), so their extra words never count.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.phrases = []
+        self.owners = []
+        self.words = []
+        for position, entry in enumerate(entries):
+            issue_words = set(utils.default_process(entry.get("issue", "")).split()) - STOPWORDS
+            for phrase in [entry.get("issue", "")] + entry.get("keywords", []):
+                normalized = utils.default_process(phrase)
+                if normalized:
+                    self.phrases.append(normalized)
+                    self.owners.append(position)
+                    self.words.append(issue_words)
+
+    @classmethod
+    def from_file(cls, path=CATALOG_FILE):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def match(self, message, threshold=CATALOG_MATCH_THRESHOLD):
+        """Return (entry, score) for the best phrase scoring >= threshold, else None."""
+        query = utils.default_process(message or "")
+        words = set(query.split()) - STOPWORDS
+        if len(words) < CATALOG_MIN_SHARED_WORDS or not self.phrases:
+            return None
+
+        candidates = process.extract(
+            query, self.phrases,
+            scorer=fuzz.token_set_ratio,
+            processor=None,
+            score_cutoff=threshold,
+            limit=None
+        )
+        best = None
+        for phrase, score, phrase_index in candidates:
+            issue_words = self.words[phrase_index]
+            shared = len(words & issue_words)
+            if shared < CATALOG_MIN_SHARED_WORDS or shared < CATALOG_MIN_COVERAGE * len(issue_words):
+                continue
+            # Many phrases can tie on token_set_ratio; prefer the one closest to the whole message.
+            rank = (score, fuzz.token_sort_ratio(query, phrase))
+            if best is None or rank > best[0]:
+                best = (rank, phrase_index)
+        if not best:
+            return None
+
+        (score, _), phrase_index = best
+        return self.entries[self.owners[phrase_index]], score
+
+
+def catalog_solution(entry):
+    """Shape a catalog entry like the dict returned by generate_gpt_solution."""
+    benefits = []
+    roi = "N/A"
+    for benefit in entry.get("benefits", []):
+        if benefit.startswith("ROI:"):
+            if not ROI_PLACEHOLDER.search(benefit):
+                roi = benefit[len("ROI:"):].strip()
+        else:
+            benefits.append(benefit)
+
+    return {
+        "product": entry.get("product", "N/A"),
+        "module": entry.get("features", []),
+        "how_it_works": entry.get("solution", "N/A"),
+        "benefits": benefits,
+        "roi": roi,
+        "disclaimer": entry.get("disclaimer", ""),
+        "full_solution": entry.get("solution", "N/A"),
+        "token_count": 0,
+        "token_cost": 0
+    }
@@ -0,0 +1,87 @@
+# clients.py
+
+import os
+import openai
+from openai import api_requestor
+import httplib2
+import requests
+from requests.adapters import HTTPAdapter
+from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 16))
+OPENAI_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OPENAI_CONNECT_TIMEOUT_SECONDS", 5))
+OPENAI_READ_TIMEOUT_SECONDS = float(os.getenv("OPENAI_READ_TIMEOUT_SECONDS", 45))
+OPENAI_REQUEST_TIMEOUT = (OPENAI_CONNECT_TIMEOUT_SECONDS, OPENAI_READ_TIMEOUT_SECONDS)
+SHEETS_TIMEOUT_SECONDS = float(os.getenv("SHEETS_TIMEOUT_SECONDS", 15))
+SHEETS_SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+
+# Stand-ins installed by use_backends() (see fakes.py); None means the real service.
+backend_overrides = {"chat": None, "sheets": None}
+
+
+def use_backends(chat=None, sheets=None):
+    """Route OpenAI chat completions and/or Sheets writes to substitute backends."""
+    backend_overrides["chat"] = chat
+    backend_overrides["sheets"] = sheets
+
+
+def chat_completion(**kwargs):
+    """`openai.ChatCompletion.create`, or the installed stand-in."""
+    create = backend_overrides["chat"] or openai.ChatCompletion.create
+    return create(**kwargs)
+
+
+def sheets_client(service_account_file):
+    """The installed Sheets stand-in, or a real client built from the service account file."""
+    return backend_overrides["sheets"] or build_sheets_client(service_account_file)
+
+
+class SharedPoolSession(requests.Session):
+    """A session over the shared OpenAI connection pool that never closes the pool.
+
+    openai 0.28 closes and replaces each thread's session every
+    MAX_SESSION_LIFETIME_SECS; with this, that only drops the session object.
+    """
+
+    def close(self):
+        pass
+
+
+def configure_openai(api_key):
+    """Share one keep-alive connection pool across all request threads.
+
+    openai 0.28 keeps a session per thread and recycles it every few minutes,
+    so connections to api.openai.com would be re-established constantly.
+    `requestssession` is set to a factory: each thread still gets its own
+    session, but every session mounts the same adapter, and recycling a
+    session leaves the pooled connections open. Connection retries stay at
+    openai's default.
+    """
+    adapter = HTTPAdapter(
+        pool_connections=2, pool_maxsize=HTTP_POOL_SIZE, max_retries=api_requestor.MAX_CONNECTION_RETRIES
+    )
+
+    def session_factory():
+        session = SharedPoolSession()
+        session.mount("https://", adapter)
+        return session
+
+    openai.api_key = api_key
+    openai.requestssession = session_factory
+    return adapter
+
+
+def build_sheets_client(service_account_file):
+    """Sheets `spreadsheets()` resource over a persistent httplib2 connection with a timeout.
+
+    httplib2 connections are not thread-safe; the client is only used by the
+    Sheets logger's writer thread.
+    """
+    credentials = service_account.Credentials.from_service_account_file(
+        service_account_file, scopes=SHEETS_SCOPES
+    )
+    http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=SHEETS_TIMEOUT_SECONDS))
+    # The discovery document bundled with googleapiclient avoids a network fetch at build time.
+    return build("sheets", "v4", http=http, cache_discovery=False, static_discovery=True).spreadsheets()
@@ -0,0 +1,152 @@
+# fakes.py
+
+import os
+import json
+import time
+import random
+import threading
+import openai
+import httplib2
+from googleapiclient.errors import HttpError
+from clients import use_backends
+
+FAKE_FEATURES = [
+    ("Automated Care Messaging", ["ACM Alerts"]),
+    ("Automated Care Messaging", ["ACM Messenger", "ACM Vault"]),
+    ("Automated Care Messaging", ["ACM Concierge"]),
+    ("Automated Care Scheduling", ["ACS Booking"]),
+    ("Automated Care Scheduling", ["ACS Forms"]),
+    ("Automated Care Messaging, Automated Care Scheduling", ["ACM Alerts", "ACS Forms"])
+]
+
+
+class FakeChatCompletion:
+    """Offline stand-in for `openai.ChatCompletion.create`.
+
+    Sleeps for `latency_ms` (+/- `jitter_ms`), then returns a well-formed
+    solution JSON. `rate_limit_rate` and `error_rate` are the fractions of
+    calls that raise openai's RateLimitError and APIError instead. With
+    stream=True the content arrives in small chunks spread over the latency.
+    """
+
+    def __init__(self, latency_ms=2000, jitter_ms=500, error_rate=0.0, rate_limit_rate=0.0, chunk_size=12):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, model="gpt-4", messages=(), stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            time.sleep(0.05)
+            raise openai.error.RateLimitError("Fake rate limit reached for requests", http_status=429)
+        if roll < self.rate_limit_rate + self.error_rate:
+            time.sleep(self.latency_ms / 2000)
+            raise openai.error.APIError("Fake upstream error", http_status=500)
+
+        prompt = messages[-1]["content"] if messages else ""
+        content = self.completion(prompt)
+        latency = max(0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+        if stream:
+            return self._stream(model, content, latency)
+
+        time.sleep(latency)
+        return {
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+        }
+
+    def _stream(self, model, content, latency):
+        chunks = [content[i:i + self.chunk_size] for i in range(0, len(content), self.chunk_size)]
+        # Roughly a fifth of the latency before the first token, the rest spread over the chunks.
+        time.sleep(latency / 5)
+        for chunk in chunks:
+            time.sleep(latency * 4 / 5 / len(chunks))
+            yield {"model": model, "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]}
+
+    def completion(self, prompt):
+        product, features = FAKE_FEATURES[sum(map(ord, prompt)) % len(FAKE_FEATURES)]
+        return json.dumps({
+            "product": product,
+            "feature": features,
+            "how_it_works": f"{', '.join(features)} automate the outreach described, driven by live EMR data.",
+            "benefits": ["Fewer inbound phone calls.", "Less manual follow-up for staff."],
+            "roi": "Saves roughly 200 staff hours/year.",
+            "disclaimer": "Note: The ROI estimates provided are based on typical industry benchmarks and assumptions for healthcare settings. Actual ROI may vary depending on clinic size, patient volume, and specific operational factors."
+        }, indent=2)
+
+
+class FakeSheetsClient:
+    """Offline stand-in for `build("sheets", "v4").spreadsheets()`.
+
+    Appended rows are kept in `rows`. `fail_times` makes the next N appends
+    raise an HttpError with `status` (429 by default) to exercise retries;
+    `error_rate` fails that fraction of appends at random, and `latency_ms`
+    delays every append.
+    """
+
+    @staticmethod
+    def error(status):
+        return HttpError(httplib2.Response({"status": status}), f"Fake Sheets error {status}".encode(), uri="fake")
+
+    def __init__(self, fail_times=0, status=429, latency_ms=0, error_rate=0.0):
+        self.rows = []
+        self.calls = 0
+        self.fail_times = fail_times
+        self.status = status
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+
+    def values(self):
+        return self
+
+    def append(self, spreadsheetId, range, valueInputOption, body):
+        return _FakeAppendRequest(self, body["values"])
+
+    def _execute(self, rows):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if self.error_rate and random.random() < self.error_rate:
+            raise self.error(self.status)
+        with self._lock:
+            self.calls += 1
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise self.error(self.status)
+            self.rows.extend(rows)
+        return {"updates": {"updatedRows": len(rows)}}
+
+
+class _FakeAppendRequest:
+    def __init__(self, client, rows):
+        self.client = client
+        self.rows = rows
+
+    def execute(self):
+        return self.client._execute(self.rows)
+
+
+def install_fake_backends():
+    """Swap OpenAI and Sheets for local fakes configured from FAKE_* env vars."""
+    chat = FakeChatCompletion(
+        latency_ms=float(os.getenv("FAKE_OPENAI_LATENCY_MS", 2000)),
+        jitter_ms=float(os.getenv("FAKE_OPENAI_JITTER_MS", 500)),
+        error_rate=float(os.getenv("FAKE_OPENAI_ERROR_RATE", 0)),
+        rate_limit_rate=float(os.getenv("FAKE_OPENAI_RATE_LIMIT_RATE", 0))
+    )
+    sheets = FakeSheetsClient(
+        latency_ms=float(os.getenv("FAKE_SHEETS_LATENCY_MS", 300)),
+        error_rate=float(os.getenv("FAKE_SHEETS_ERROR_RATE", 0))
+    )
+    use_backends(chat=chat, sheets=sheets)
+    print("🧪 Using fake OpenAI and Sheets backends")
+    return chat, sheets
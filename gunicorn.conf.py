@@ -0,0 +1,56 @@
+# gunicorn.conf.py
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 10000)}"
+
+# Each /ai request spends most of its time waiting on OpenAI, so threads
+# (not CPU) are what let a dyno keep many requests in flight.
+worker_class = "gthread"
+# Exported so admission.py, imported by the workers, splits the OpenAI rate
+# limits across the same number of processes.
+os.environ.setdefault("WEB_CONCURRENCY", "2")
+workers = int(os.environ["WEB_CONCURRENCY"])
+threads = int(os.getenv("GUNICORN_THREADS", 16))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 90))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+# Import the app once in the master, then fork.
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # Start each deploy with empty Prometheus multiprocess files.
+    multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for name in os.listdir(multiproc_dir):
+            os.remove(os.path.join(multiproc_dir, name))
+
+
+def when_ready(server):
+    # The port is bound by now, so the platform sees the dyno as up while the
+    # master warms the preloaded app; forked workers inherit the warm state.
+    if server.cfg.preload_app:
+        import app
+        app.warm_up.run()
+
+
+def post_worker_init(worker):
+    # No-op when the master already warmed up; otherwise warm this worker
+    # before it accepts its first request.
+    import app
+    app.warm_up.run()
+    # Honour a --workers flag that overrides WEB_CONCURRENCY.
+    app.admission.worker_share = worker.cfg.workers
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
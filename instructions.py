@@ -74,3 +74,35 @@ def acm_alerts_instruction():
         "ACM Alerts is **automated, rules-based, and data-driven**, enabling healthcare providers to deliver the right message at the right time without manual effort."
     )
 
+
+def check_in_instruction():
+    return (
+        "\n🧠 Special Instruction:\n"
+        "Patients cannot check in from home using ACS Forms alone.\n"
+        "ACS Forms supports intake, not actual appointment check-in.\n"
+        "Recommend ACS Booking only if 'remote check-in' implies full online appointment workflows."
+    )
+
+def reminder_communication_instruction():
+    return (
+        "\n🧠 Special Instruction:\n"
+        "If the input includes 'automated reminders', 'custom reminders', 'real-time alerts', or 'same-day updates', prioritize ACM Alerts.\n"
+        "Use ACM Messenger only if the context clearly describes reminders sent well in advance of the appointment (e.g., routine scheduling)."
+    )
+
+def two_way_messaging_instruction():
+    return (
+        "\n🧠 Special Instruction:\n"
+        "ACM Messenger supports two-way messaging only when configured with the Text Response Message Type.\n"
+        "Two-way responses are supported via voice, text, and email — depending on the patient's original communication channel.\n"
+        "Do not imply that all ACM Messenger messages allow replies.\n"
+        "Clarify this is an optional, configurable feature for interactive outreach."
+    )
+
+def audience_filtering_instruction():
+    return (
+        "\n🧠 Special Instruction:\n"
+        "All ACM modules (Messenger, Alerts, Vault) support audience filtering based on EMR data such as resident or patient location (e.g., floor, unit, clinic), appointment type or provider, and visit status or scheduling logic.\n"
+        "If the challenge involves notifying specific groups (e.g., only 2nd floor residents, flu shot recipients, patients of a specific provider), emphasize that Cliniconex can target communications precisely to avoid sending irrelevant or broad messages.\n"
+        "This filtering is essential to reducing message fatigue, ensuring compliance, and improving engagement."
+    )
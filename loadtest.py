@@ -0,0 +1,229 @@
+# loadtest.py
+"""Offline load test and latency benchmark for /ai.
+
+Replays messages built from cliniconex_solutions.json against the app at
+fixed concurrency levels and reports p50/p95/p99 latency, requests/s and a
+per-stage breakdown taken from the Server-Timing response header.
+
+By default the app runs in-process with fake OpenAI and Sheets backends
+(see fakes.py), so no credentials or network are needed:
+
+    python loadtest.py --concurrency 1,8,32 --requests 200
+
+To benchmark a running server instead, start it with FAKE_BACKENDS=true
+(and any FAKE_* settings) and pass --url http://localhost:10000.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import contextlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from timing import parse_server_timing
+
+GPT_TEMPLATES = [
+    "At our clinic we keep running into {phrase} and the front desk is frustrated",
+    "Our team spends hours every week dealing with {phrase}, what would you suggest?",
+    "We are a long-term care home and {phrase} keeps coming up with families"
+]
+
+
+def reworded(phrase):
+    """The first half of a catalog phrase: still on topic, but no longer a catalog match."""
+    words = phrase.lower().split()
+    return " ".join(words[:max(2, len(words) // 2)])
+
+
+def build_corpus(mode, path=None):
+    """Messages from catalog issues/keywords: verbatim ("catalog"), reworded ("gpt"), or both ("mixed")."""
+    # Imported here: catalog loads response_cache, whose settings main() sets through the environment first.
+    from catalog import CATALOG_FILE, CatalogIndex
+    with open(path or CATALOG_FILE, encoding="utf-8") as f:
+        entries = json.load(f)
+
+    phrases = [phrase for entry in entries for phrase in [entry["issue"]] + entry.get("keywords", [])]
+    catalog_messages = phrases
+    # The catalog matches any message containing a whole phrase, so "gpt" messages
+    # use part of one, and any that would still match are dropped.
+    index = CatalogIndex(entries)
+    gpt_messages = [
+        message for message in (
+            GPT_TEMPLATES[i % len(GPT_TEMPLATES)].format(phrase=reworded(phrase)) for i, phrase in enumerate(phrases)
+        )
+        if not index.match(message)
+    ]
+
+    if mode == "catalog":
+        return catalog_messages
+    if mode == "gpt":
+        return gpt_messages
+    return [message for pair in zip(catalog_messages, gpt_messages) for message in pair]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class InProcessTarget:
+    def __init__(self):
+        import app
+        app.warm_up.run()
+        self.app = app
+        self._local = threading.local()
+
+    def post(self, message, page_url):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.app.test_client()
+        response = client.post("/ai", json={"message": message, "page_url": page_url})
+        return response.status_code, response.headers.get("Server-Timing")
+
+
+class HttpTarget:
+    def __init__(self, url):
+        import requests
+        self.url = url.rstrip("/") + "/ai"
+        self.requests = requests
+        self._local = threading.local()
+
+    def post(self, message, page_url):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self.requests.Session()
+        try:
+            response = session.post(self.url, json={"message": message, "page_url": page_url}, timeout=120)
+        except self.requests.RequestException:
+            return 0, None
+        return response.status_code, response.headers.get("Server-Timing")
+
+
+def run_level(target, corpus, concurrency, total_requests, offset=0):
+    # Each level starts where the previous one stopped, so it asks questions the
+    # response cache has not seen yet instead of replaying the first level's.
+    messages = [corpus[(offset + i) % len(corpus)] for i in range(total_requests)]
+    results = []
+    lock = threading.Lock()
+
+    def one(index):
+        start = time.perf_counter()
+        status_code, server_timing = target.post(messages[index], f"loadtest://c{concurrency}/{index}")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with lock:
+            results.append((elapsed_ms, status_code, parse_server_timing(server_timing)))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total_requests)))
+    wall_seconds = time.perf_counter() - started
+
+    latencies = [elapsed for elapsed, _, _ in results]
+    stages = {}
+    for _, _, timings in results:
+        for name, ms in timings.items():
+            stages.setdefault(name, []).append(ms)
+
+    return {
+        "concurrency": concurrency,
+        "corpus_offset": offset,
+        "requests": len(results),
+        "errors": sum(1 for _, status_code, _ in results if status_code != 200),
+        "requests_per_second": round(len(results) / wall_seconds, 2) if wall_seconds else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "stages": {
+            name: {
+                "count": len(values),
+                "mean_ms": round(sum(values) / len(values), 2),
+                "p95_ms": round(percentile(values, 95), 2)
+            }
+            for name, values in stages.items()
+        }
+    }
+
+
+def print_report(levels):
+    print(f"\n{'concurrency':>11} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for level in levels:
+        print(f"{level['concurrency']:>11} {level['requests']:>8} {level['errors']:>6} "
+              f"{level['requests_per_second']:>8} {level['p50_ms']:>9} {level['p95_ms']:>9} {level['p99_ms']:>9}")
+
+    for level in levels:
+        print(f"\nStage breakdown at concurrency {level['concurrency']}:")
+        print(f"  {'stage':<10} {'count':>6} {'mean ms':>9} {'p95 ms':>9}")
+        for name, stats in sorted(level["stages"].items(), key=lambda item: -item[1]["mean_ms"]):
+            print(f"  {name:<10} {stats['count']:>6} {stats['mean_ms']:>9} {stats['p95_ms']:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the /ai endpoint.")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--mode", choices=["mixed", "catalog", "gpt"], default="mixed",
+                        help="catalog phrases verbatim, reworded to miss the catalog, or both")
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--cold", action="store_true", help="disable the response cache")
+    parser.add_argument("--openai-latency-ms", type=float, default=2000)
+    parser.add_argument("--openai-jitter-ms", type=float, default=500)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--sheets-latency-ms", type=float, default=300)
+    parser.add_argument("--sheets-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", dest="json_path", help="also write the results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's per-request output")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        target = HttpTarget(args.url)
+    else:
+        workdir = tempfile.mkdtemp(prefix="cliniconex-loadtest-")
+        os.environ.update({
+            "FAKE_BACKENDS": "true",
+            "FAKE_OPENAI_LATENCY_MS": str(args.openai_latency_ms),
+            "FAKE_OPENAI_JITTER_MS": str(args.openai_jitter_ms),
+            "FAKE_OPENAI_ERROR_RATE": str(args.openai_error_rate),
+            "FAKE_OPENAI_RATE_LIMIT_RATE": str(args.openai_rate_limit_rate),
+            "FAKE_SHEETS_LATENCY_MS": str(args.sheets_latency_ms),
+            "FAKE_SHEETS_ERROR_RATE": str(args.sheets_error_rate),
+            "RESPONSE_CACHE_FILE": os.path.join(workdir, "response_cache.sqlite3"),
+            "SHEETS_LOG_SPILL_FILE": os.path.join(workdir, "sheets_spill.jsonl")
+        })
+        if args.cold:
+            os.environ["RESPONSE_CACHE_MAX_ENTRIES"] = "0"
+
+    random.seed(args.seed)
+    corpus = build_corpus(args.mode)
+    random.shuffle(corpus)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        if not args.url:
+            target = InProcessTarget()
+        levels = [
+            run_level(target, corpus, int(level), args.requests, offset=position * args.requests)
+            for position, level in enumerate(args.concurrency.split(","))
+        ]
+    if len(levels) * args.requests > len(corpus) and not args.cold:
+        print(f"⚠️ {len(levels) * args.requests} requests exceed the {len(corpus)}-message corpus; later levels "
+              f"include response cache hits. Use --cold or fewer --requests for comparable levels.", file=sys.stderr)
+    print_report(levels)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"mode": args.mode, "levels": levels}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+# metrics.py
+
+import os
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from timing import stage_observers
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "ai_widget_stage_seconds", "Time spent in each stage of handling a request.",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+SOLUTIONS = Counter(
+    "ai_widget_solutions_total", "Solutions returned, by endpoint and how they were produced.",
+    ["endpoint", "status"]
+)
+GPT_FALLBACKS = Counter(
+    "ai_widget_gpt_fallbacks_total", "GPT calls that ended in the generic fallback answer.", ["reason"]
+)
+JSON_PARSE_FAILURES = Counter(
+    "ai_widget_json_parse_failures_total", "GPT completions that could not be parsed as JSON."
+)
+UNSUPPORTED_TERMS = Counter(
+    "ai_widget_unsupported_terms_total", "Messages short-circuited by the unsupported-terms list."
+)
+UPSTREAM_ERRORS = Counter(
+    "ai_widget_upstream_errors_total", "Errors returned by upstream services.", ["upstream", "error"]
+)
+TOKENS = Counter("ai_widget_tokens_total", "Tokens spent on GPT calls.", ["model", "kind"])
+TOKEN_COST = Counter("ai_widget_token_cost_usd_total", "Estimated GPT spend in USD.", ["model"])
+PROMPT_INSTRUCTIONS = Counter(
+    "ai_widget_prompt_instructions_total", "Special instructions included in GPT prompts.", ["instruction"]
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "ai_widget_admission_queue_depth", "Requests waiting for OpenAI rate-limit capacity.",
+    ["model"], multiprocess_mode="livesum"
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "ai_widget_admission_wait_seconds", "Time requests waited for OpenAI rate-limit capacity.",
+    ["model"], buckets=LATENCY_BUCKETS
+)
+ADMISSION_SHED = Counter(
+    "ai_widget_admission_shed_total", "Requests rejected as busy instead of calling OpenAI.", ["model", "reason"]
+)
+ADMISSION_RATE_LIMITED = Counter(
+    "ai_widget_admission_rate_limited_total", "429 responses from OpenAI.", ["model"]
+)
+MODEL_ROUTES = Counter(
+    "ai_widget_model_routes_total", "Winning GPT completions by model and route (primary, hedge, failover).",
+    ["model", "route"]
+)
+MODEL_HEDGES = Counter(
+    "ai_widget_model_hedges_total", "Hedge requests started because an earlier model was slow.", ["model"]
+)
+OUTPUT_VALIDATION_FAILURES = Counter(
+    "ai_widget_output_validation_failures_total", "GPT solution fields that failed schema validation.", ["field"]
+)
+OUTPUT_REPAIRS = Counter(
+    "ai_widget_output_repairs_total", "Repair calls for invalid GPT solution fields, by result.", ["result"]
+)
+
+stage_observers.append(lambda name, seconds: STAGE_SECONDS.labels(name).observe(seconds))
+
+
+def observe_upstream_error(upstream, error):
+    UPSTREAM_ERRORS.labels(upstream, type(error).__name__).inc()
+
+
+def observe_usage(model, input_tokens, output_tokens, cost):
+    TOKENS.labels(model, "input").inc(input_tokens)
+    TOKENS.labels(model, "output").inc(output_tokens)
+    TOKEN_COST.labels(model).inc(cost)
+
+
+def render():
+    """Return (body, content_type) for a Prometheus scrape.
+
+    Under gunicorn with PROMETHEUS_MULTIPROC_DIR set, every worker writes its
+    samples to that directory and a scrape of any worker aggregates them all.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,229 @@
+# prompts.py
+
+import re
+import threading
+from collections import Counter
+import instructions
+from response_cache import normalize_message
+
+GPT_PROMPT_TEMPLATE = """
+    You are a Cliniconex solutions expert with deep expertise in the company’s full suite of products and features. You can confidently assess any healthcare-related issue and determine the most effective solution—whether it involves a single product or a combination of offerings. You understand how each feature functions within the broader Automated Care Platform (ACP) and are skilled at tailoring precise recommendations to address real-world clinical, operational, and administrative challenges.
+
+    Cliniconex offers **Automated Care Platform (ACP)** — a complete system for communication, coordination, and care automation. ACP is composed of two core solutions:
+
+    **Automated Care Messaging (ACM):**
+
+    **ACM Messenger** delivers automated, personalized outreach across voice, text, and email—driven by EMR data. Designed to send timely reminders, instructions, and care updates, ACM Messenger uses dynamic content and configurable workflows to ensure the right information reaches the right person at the right time.
+
+    **ACM Vault** provides secure, encrypted communication for sensitive health information—fully integrated with ACM Messenger. ACM Vault enables healthcare providers to send encrypted messages and documents via **email only**, ensuring HIPAA, PHIPA, and PIPEDA compliance. It is purpose-built to protect patient privacy, reduce risk, and support audit readiness while automating secure communication workflows.
+
+    **ACM Alerts** – Real-time, automated notifications for urgent or time-sensitive updates—delivered via voice, text, or email. ACM Alerts empowers healthcare providers to reach patients, families, and staff instantly with critical messages such as closures, emergencies, or last-minute changes. Fully configurable and EMR-integrated, it ensures rapid, targeted outreach when every second counts.
+
+    **ACM Concierge** – Real-time wait time displays and virtual queuing that keep patients informed and engaged. ACM Concierge integrates with your EMR to publish accurate queue updates on websites, in-clinic screens, or via text. Patients can opt in for return-time notifications, improving satisfaction, reducing front-desk interruptions, and creating a calmer, more efficient waiting experience.
+
+    **Automated Care Scheduling (ACS):**
+
+    **ACS Booking** – Lets patients book their own appointments online, anytime. Integrated with your EMR, it keeps schedules up to date, reduces no-shows, and saves staff time by cutting down on phone calls and manual entry. Simple for patients, easier for your team.
+
+    **ACS Forms** – Digital forms that collect patient information before the appointment. Fully integrated with your EMR, ACS Forms replaces paper intake with customizable forms patients can complete online. Save time, reduce errors, and make check-ins easier for everyone.
+
+    **ACS Surveys** – Automatically sends surveys to patients after visits or key events. Collects feedback, tracks trends, and helps you understand where to improve. Easy to set up, fully integrated with your EMR, and built to support better care through real insights.
+
+    🛑 IMPORTANT: Do not use definite articles (e.g., “the”) in front of product or feature names.
+        ✅ Always refer to product and module names exactly as listed: 
+        - Automated Care Messaging, Automated Care Scheduling
+        - ACM Messenger, ACM Vault, ACM Alerts, ACM Concierge
+        - ACS Booking, ACS Forms, ACS Surveys
+        ❌ Do NOT say: “the ACM Messenger,” “the ACS Forms,” etc.
+
+    🧩 Product Attribution Rule:
+    - Assign "Automated Care Messaging" if all selected features are from ACM modules.
+    - Assign "Automated Care Scheduling" if all selected features are from ACS modules.
+    - Assign both ("Automated Care Messaging, Automated Care Scheduling") if features are drawn from both categories.
+    - Never assign a product unless one of its features is used.
+
+    Here is a real-world issue described by a healthcare provider:
+    "{message}"
+
+IMPORTANT: Be sure you pay attention to the special instructions below.
+
+### 🧠 Special Instructions for Accurate Feature Selection and Solution Formation:
+
+{instructions}
+
+Your response must include:
+1. product
+2. Module
+3. how_it_works (1 paragraph)
+4. benefits (2-3 concise bullet points)
+5. roi (quantified, realistic)
+6. disclaimer (standardized)
+
+Your job is to:
+
+1. **Determine the best product(s)**: Choose between Automated Care Messaging, Automated Care Scheduling, or both.
+2. **Select features** from the list below that best solve the issue. Include all relevant features but avoid unnecessary ones.
+3. **Explain how the solution works** in one clear paragraph—connect the feature to the provider's challenge and show how it fits in ACP.
+4. **List 2–3 operational benefits** tailored to the problem. Avoid repeating phrases from other solutions.
+5. **Estimate ROI** tailored to the input:
+- Focus on quantifiable gains: fewer calls, reduced no-shows, saved staff hours, increased patient throughput.
+- Anchor estimates to the specific issue described.
+- Keep numbers conservative and realistic (e.g., 10–25% efficiency gains).
+- Vary the format to avoid repetition. Use hours/year, % improvement, $ saved, or reduced manual workload.
+
+🛑 IMPORTANT: Do not use definite articles (“the”) before feature or product names.
+
+🧩 Product Attribution Rule:
+- Use "Automated Care Messaging" if all features are from ACM modules.
+- Use "Automated Care Scheduling" if all features are from ACS modules.
+- Use both if applicable.
+
+Respond ONLY in this exact JSON format:
+
+{{
+"product": "Automated Care Messaging",
+"feature": ["ACM Alerts", "ACS Forms"],
+"how_it_works": "One paragraph tailored to the problem.",
+"benefits": [
+"Tailored benefit based on input.",
+"Another tailored operational gain.",
+"Optional third, if useful."
+],
+"roi": "Anchored to the specific challenge, e.g., Saves 250 hours/year by reducing phone calls for patient instructions.",
+"disclaimer": "Note: The ROI estimates provided are based on typical industry benchmarks and assumptions for healthcare settings. Actual ROI may vary depending on clinic size, patient volume, and specific operational factors."
+}}
+
+    Do not include anything outside the JSON block.
+    Focus on solving the issue. Be specific. Avoid generic or repeated phrases. Use real-world healthcare workflow language.
+    """
+
+# Always included, whatever the message says.
+CORE_INSTRUCTIONS = ["acm_vault"]
+
+# name -> (instruction block, trigger terms). Terms are matched as whole words
+# on the normalized message, each word in any of its common inflections
+# ("miss appointment" also matches "missed appointments", "missing appointment").
+# Keep terms specific: a bare common word fires its instruction on unrelated text.
+INSTRUCTION_TRIGGERS = {
+    "acm_vault": (instructions.acm_vault_instruction, [
+        "vault", "secure", "encrypted", "encryption", "sensitive", "privacy", "confidential"
+    ]),
+    "no_show": (instructions.no_show_instruction, [
+        "no show", "noshow", "miss appointment", "miss their appointment", "miss visit",
+        "miss their visit", "skip appointment", "skip visit", "attendance", "don t show", "didn t show", "doesn t show",
+        "not show up", "fail to show", "forget appointment", "forget their appointment"
+    ]),
+    "family_portal": (instructions.family_portal_instruction, [
+        "family", "families", "portal", "login", "log in", "caregiver", "relative",
+        "next of kin", "loved one"
+    ]),
+    "automation_efficiency": (instructions.automation_efficiency_instruction, [
+        "manual", "manually", "workload", "staff time", "phone call", "calling", "repetitive",
+        "automate", "automation", "automated", "bottleneck", "overwhelmed", "burnout",
+        "efficiency", "inefficient", "admin burden", "overloaded", "too many calls"
+    ]),
+    "ai_message_assistant": (instructions.ai_message_assistant_instruction, [
+        "wording", "draft", "drafting", "message content", "compose",
+        "ai assistant", "ai writing", "message template"
+    ]),
+    "unprepared_patient": (instructions.unprepared_patient_instruction, [
+        "unprepared", "confused", "confusion", "prepare", "preparation", "prep",
+        "instruction", "fasting", "where to go", "when to arrive", "what to bring",
+        "paperwork", "intake", "form"
+    ]),
+    "ehr_integration": (instructions.ehr_integration_instruction, [
+        "emr", "ehr", "integration", "integrate", "pointclickcare", "oscar", "accuro",
+        "epic", "cerner", "data entry", "middleware", "double entry"
+    ]),
+    "acm_alerts": (instructions.acm_alerts_instruction, [
+        "alert", "notification", "notify", "waitlist", "wait list", "cancellation",
+        "cancel", "recall", "rebook", "reschedule", "last minute", "same day", "urgent",
+        "emergency", "closure", "confirmation", "confirm", "no show", "miss appointment",
+        "infection", "outbreak", "campaign", "return time"
+    ]),
+    "check_in": (instructions.check_in_instruction, [
+        "check in", "checkin", "remote check", "arrival", "front desk", "kiosk", "waiting room"
+    ]),
+    "reminder_communication": (instructions.reminder_communication_instruction, [
+        "reminder", "remind", "real time", "same day", "status update", "care update"
+    ]),
+    "two_way_messaging": (instructions.two_way_messaging_instruction, [
+        "reply", "respond", "two way", "text back", "confirm", "confirmation", "interactive"
+    ]),
+    "audience_filtering": (instructions.audience_filtering_instruction, [
+        "specific group", "floor", "unit", "target", "resident", "flu shot", "vaccine",
+        "vaccination", "location", "department", "segment", "broadcast"
+    ])
+}
+
+
+def inflected(word):
+    """Regex for a word and its common inflections (remind/reminded, skip/skipping, notify/notified...)."""
+    if len(word) > 3 and word.endswith("e"):
+        return re.escape(word[:-1]) + "(?:e|es|ed|ing)"
+    if len(word) > 3 and word.endswith("y") and word[-2] not in "aeiou":
+        return re.escape(word[:-1]) + "(?:y|ies|ied|ying)"
+    return re.escape(word) + f"(?:s|es|{re.escape(word[-1])}?(?:ed|ing))?"
+
+
+def term_pattern(term):
+    return r"\s+".join(inflected(word) for word in term.split())
+
+
+class PromptAssembler:
+    """Builds the GPT prompt from the fixed core plus only the relevant instructions.
+
+    Every trigger term is compiled into one alternation regex. Because a regex
+    reports one match per position, each matched phrase is also credited with
+    the instructions of any shorter registered term it contains ("missed
+    appointment" also fires everything "appointment" would).
+    """
+
+    def __init__(self, template=GPT_PROMPT_TEMPLATE, triggers=INSTRUCTION_TRIGGERS, core=CORE_INSTRUCTIONS):
+        self.template = template
+        self.core = list(core)
+        self.blocks = {name: block() for name, (block, _) in triggers.items()}
+        self.order = list(triggers)
+
+        owners = {}
+        for name, (_, terms) in triggers.items():
+            for term in terms:
+                owners.setdefault(normalize_message(term, strip_stopwords=False), set()).add(name)
+        self.term_patterns = [
+            (re.compile(rf"\b{term_pattern(term)}\b"), names) for term, names in owners.items()
+        ]
+        self.phrase_owners = {}
+
+        alternation = "|".join(term_pattern(term) for term in sorted(owners, key=len, reverse=True))
+        self.pattern = re.compile(rf"\b(?:{alternation})\b")
+        self.fired_counts = Counter()
+        self._lock = threading.Lock()
+
+    def _owners(self, phrase):
+        names = self.phrase_owners.get(phrase)
+        if names is None:
+            names = set().union(*(owners for pattern, owners in self.term_patterns if pattern.search(phrase)))
+            self.phrase_owners[phrase] = names
+        return names
+
+    def select(self, message):
+        """Return the instruction names for a message, core first, in registry order."""
+        fired = set(self.core)
+        for match in self.pattern.finditer(normalize_message(message, strip_stopwords=False)):
+            fired |= self._owners(match.group(0))
+        return [name for name in self.order if name in fired]
+
+    def assemble(self, message):
+        """Return (prompt_text, instruction_names) for a message."""
+        names = self.select(message)
+        with self._lock:
+            self.fired_counts.update(names)
+        text = self.template.format(
+            message=message,
+            instructions="\n".join(self.blocks[name] for name in names)
+        )
+        return text, names
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.fired_counts)
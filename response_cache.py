@@ -0,0 +1,131 @@
+# response_cache.py
+
+import os
+import re
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+
+RESPONSE_CACHE_FILE = os.getenv(
+    "RESPONSE_CACHE_FILE", os.path.join(tempfile.gettempdir(), "cliniconex_response_cache.sqlite3")
+)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 5000))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+RESPONSE_CACHE_STRIP_STOPWORDS = os.getenv("RESPONSE_CACHE_STRIP_STOPWORDS", "false").lower() == "true"
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "for", "in", "on", "at", "by", "with",
+    "is", "are", "was", "were", "be", "our", "we", "my", "i", "me", "us", "it", "its",
+    "how", "do", "does", "can", "could", "what", "which", "that", "this", "there",
+    "too", "many", "much", "so", "very", "some", "any", "about", "from", "into"
+}
+
+
+def normalize_message(message, strip_stopwords=RESPONSE_CACHE_STRIP_STOPWORDS):
+    """Fold case, punctuation and whitespace so trivially different messages share a key."""
+    words = re.sub(r"[^\w\s]|_", " ", (message or "").lower()).split()
+    if strip_stopwords:
+        words = [word for word in words if word not in STOPWORDS] or words
+    return " ".join(words)
+
+
+class ResponseCache:
+    """LRU + TTL cache of GPT solutions stored in SQLite.
+
+    The database file is shared by every worker process on the host, so a hit
+    recorded by one worker is served to all of them. Each thread (and each
+    forked process) opens its own connection.
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_FILE, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 ttl_seconds=RESPONSE_CACHE_TTL_SECONDS, strip_stopwords=RESPONSE_CACHE_STRIP_STOPWORDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.strip_stopwords = strip_stopwords
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def key(self, message):
+        return normalize_message(message, self.strip_stopwords)
+
+    def _count(self, conn, name):
+        conn.execute(
+            "INSERT INTO stats (name, count) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET count = count + 1",
+            (name,)
+        )
+
+    def get(self, message):
+        key = self.key(message)
+        if not key:
+            return None
+
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+
+        if row and now - row[1] <= self.ttl_seconds:
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._count(conn, "hits")
+            return json.loads(row[0])
+
+        if row:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self._count(conn, "misses")
+        return None
+
+    def set(self, message, value):
+        key = self.key(message)
+        if not key:
+            return
+
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self):
+        conn = self._connection()
+        counts = dict(conn.execute("SELECT name, count FROM stats").fetchall())
+        hits, misses = counts.get("hits", 0), counts.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "entries": conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0],
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds
+        }
@@ -0,0 +1,135 @@
+# routing.py
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from admission import Busy
+import metrics
+
+MODEL_CHAIN = [model.strip() for model in os.getenv("MODEL_CHAIN", "gpt-4").split(",") if model.strip()]
+LATENCY_BUDGET_SECONDS = float(os.getenv("LATENCY_BUDGET_SECONDS", 40))
+HEDGE_DELAY_SECONDS = float(os.getenv("HEDGE_DELAY_SECONDS", 6))
+ROUTER_POOL_SIZE = int(os.getenv("ROUTER_POOL_SIZE", 32))
+
+
+class LatencyBudgetExceeded(Exception):
+    pass
+
+
+class ModelRouter:
+    """Runs a completion down a chain of models within a latency budget.
+
+    The first model is called straight away. If it has not produced a valid
+    answer within HEDGE_DELAY_SECONDS, the next model is started alongside
+    it (a hedge); if it fails outright, the next model starts immediately (a
+    failover). The first valid answer wins. The usage of every completion
+    that is not used (an invalid answer, or a call still running when a
+    winner is found or the budget runs out, since those cannot be cancelled)
+    is reported through `on_abandoned`.
+
+    For each request, `call(model, input_tokens, remaining_seconds)` returns
+    the raw completion text, `prompt_tokens(model)` returns the prompt's token
+    count for a model and `validate(raw)` says whether a completion is usable.
+    """
+
+    def __init__(self, chain=None, budget_seconds=LATENCY_BUDGET_SECONDS,
+                 hedge_delay_seconds=HEDGE_DELAY_SECONDS, on_abandoned=None):
+        self.chain = list(chain or MODEL_CHAIN)
+        self.budget_seconds = budget_seconds
+        self.hedge_delay_seconds = hedge_delay_seconds
+        self.on_abandoned = on_abandoned
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        # Executor threads do not survive fork; give each worker process its own pool.
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=ROUTER_POOL_SIZE, thread_name_prefix="model-router")
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    @staticmethod
+    def _attempt(call, model, input_tokens, deadline):
+        return call(model, input_tokens, deadline - time.monotonic()), input_tokens
+
+    def complete(self, call, prompt_tokens, validate, on_abandoned=None):
+        """Return (raw_output, model, input_tokens, route); route is "primary", "hedge" or "failover".
+
+        `on_abandoned`, if given, replaces the router's own for this request.
+        """
+        on_abandoned = on_abandoned or self.on_abandoned
+        executor = self._executor()
+        deadline = time.monotonic() + self.budget_seconds
+        pending = {}
+        errors = []
+        next_index = 0
+        next_hedge_at = deadline
+
+        def launch(route):
+            nonlocal next_index, next_hedge_at
+            model = self.chain[next_index]
+            future = executor.submit(self._attempt, call, model, prompt_tokens(model), deadline)
+            pending[future] = (model, route)
+            next_index += 1
+            next_hedge_at = time.monotonic() + self.hedge_delay_seconds
+            if route == "hedge":
+                metrics.MODEL_HEDGES.labels(model).inc()
+            print(f"🧭 Calling {model} ({route})")
+
+        launch("primary")
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            can_hedge = next_index < len(self.chain)
+            timeout = (min(deadline, next_hedge_at) if can_hedge else deadline) - now
+            done, _ = wait(list(pending), timeout=max(0.0, timeout), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                model, route = pending.pop(future)
+                try:
+                    raw_output, input_tokens = future.result()
+                    if validate(raw_output):
+                        self._abandon(pending, on_abandoned)
+                        metrics.MODEL_ROUTES.labels(model, route).inc()
+                        return raw_output, model, input_tokens, route
+                    metrics.JSON_PARSE_FAILURES.inc()
+                    if on_abandoned:
+                        on_abandoned(model, raw_output, input_tokens)
+                    errors.append(ValueError(f"Invalid JSON from {model}"))
+                except Busy as e:
+                    errors.append(e)
+                except Exception as e:
+                    metrics.observe_upstream_error("openai", e)
+                    errors.append(e)
+                print(f"❌ {model} ({route}) failed:", str(errors[-1]))
+
+            if next_index < len(self.chain) and time.monotonic() < deadline:
+                if not pending:
+                    launch("failover")
+                elif time.monotonic() >= next_hedge_at:
+                    launch("hedge")
+
+        self._abandon(pending, on_abandoned)
+        if pending or not errors:
+            raise LatencyBudgetExceeded(f"No valid completion within {self.budget_seconds}s")
+        # Only report Busy (and shed the request) when every model was busy.
+        raise ([error for error in errors if not isinstance(error, Busy)] or errors)[-1]
+
+    @staticmethod
+    def _abandon(pending, on_abandoned):
+        if not on_abandoned:
+            return
+        for future, (model, _) in pending.items():
+            future.add_done_callback(
+                lambda done, model=model: ModelRouter._report_abandoned(model, done, on_abandoned)
+            )
+
+    @staticmethod
+    def _report_abandoned(model, future, on_abandoned):
+        if future.exception() is None:
+            raw_output, input_tokens = future.result()
+            on_abandoned(model, raw_output, input_tokens)
@@ -0,0 +1,267 @@
+# sheets_logger.py
+
+import os
+import json
+import time
+import queue
+import fcntl
+import atexit
+import random
+import tempfile
+import threading
+import traceback
+from googleapiclient.errors import HttpError
+
+SHEETS_LOG_BATCH_SIZE = int(os.getenv("SHEETS_LOG_BATCH_SIZE", 50))
+SHEETS_LOG_FLUSH_SECONDS = float(os.getenv("SHEETS_LOG_FLUSH_SECONDS", 5))
+SHEETS_LOG_QUEUE_SIZE = int(os.getenv("SHEETS_LOG_QUEUE_SIZE", 1000))
+SHEETS_LOG_MAX_RETRIES = int(os.getenv("SHEETS_LOG_MAX_RETRIES", 4))
+SHEETS_LOG_SPILL_FILE = os.getenv(
+    "SHEETS_LOG_SPILL_FILE", os.path.join(tempfile.gettempdir(), "cliniconex_sheets_spill.jsonl")
+)
+
+# 4xx statuses that mean "try again later" rather than "this request is bad".
+RETRYABLE_CLIENT_STATUSES = {408, 429}
+
+
+def is_retryable(error):
+    """Only Sheets rejecting the request itself is final; outages, timeouts and quota errors are worth retrying.
+
+    Transport failures (httplib2.ServerNotFoundError, google.auth's
+    TransportError, socket errors) carry no status, so they count as
+    retryable too.
+    """
+    if isinstance(error, HttpError):
+        status = int(error.resp.status)
+        return not 400 <= status < 500 or status in RETRYABLE_CLIENT_STATUSES
+    return True
+
+
+class _RowBatch(list):
+    """Rows handed over by `enqueue_batch`, written in an append of their own."""
+
+
+class SheetsLogger:
+    """Background writer that batches Sheets rows off the request path.
+
+    Request handlers call `enqueue(row)`, which never blocks. A daemon thread
+    drains the queue and writes everything collected within
+    SHEETS_LOG_FLUSH_SECONDS (or SHEETS_LOG_BATCH_SIZE rows) in one `append`;
+    `enqueue_batch(rows)` hands over a whole batch job's rows for a bulk
+    append of their own. All appends are serialized, since the Sheets client
+    is not thread-safe.
+    Rows that fail with a retryable error are spilled to an append-only JSONL
+    file and replayed, in an append of their own, before the next batch.
+    Rows Sheets rejects outright (e.g. a 400) are narrowed down by splitting
+    the batch and the offending rows are moved to a quarantine file instead,
+    so one bad row cannot block logging. `on_error`, if given, is called
+    with every failed append attempt; `sleep` waits out retry backoff.
+    """
+
+    def __init__(self, client, spreadsheet_id, sheet_range, batch_size=SHEETS_LOG_BATCH_SIZE,
+                 flush_seconds=SHEETS_LOG_FLUSH_SECONDS, queue_size=SHEETS_LOG_QUEUE_SIZE,
+                 max_retries=SHEETS_LOG_MAX_RETRIES, spill_file=SHEETS_LOG_SPILL_FILE,
+                 rejected_file=None, on_error=None, sleep=time.sleep):
+        self.client = client
+        self.sleep = sleep
+        self.on_error = on_error
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_range = sheet_range
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_retries = max_retries
+        self.spill_file = spill_file
+        self.rejected_file = rejected_file or spill_file + ".rejected"
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._spill_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.flush)
+
+    def _writer_alive(self):
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so start (or restart) the writer in the serving process.
+        if self._writer_alive():
+            return
+        with self._start_lock:
+            if self._writer_alive():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # A queue inherited across fork holds the parent's rows (the parent writes
+                # those) and the parent's count of unfinished ones; start this process afresh.
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="sheets-logger", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, row):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            print("⚠️ Sheets log queue full; spilling row to disk")
+            self._spill([row])
+
+    def enqueue_batch(self, rows):
+        """Queue a set of rows for the writer thread to send in one bulk append."""
+        rows = _RowBatch(rows)
+        if not rows:
+            return
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(rows)
+        except queue.Full:
+            print(f"⚠️ Sheets log queue full; spilling {len(rows)} row(s) to disk")
+            self._spill(rows)
+
+    def _run(self):
+        while True:
+            rows = self.queue.get()
+            taken = 1
+            if not isinstance(rows, _RowBatch):
+                rows = [rows]
+                deadline = time.monotonic() + self.flush_seconds
+                while len(rows) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        row = self.queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    taken += 1
+                    if isinstance(row, _RowBatch):
+                        self._write(rows)
+                        rows = row
+                        break
+                    rows.append(row)
+            try:
+                self._write(rows)
+            finally:
+                for _ in range(taken):
+                    self.queue.task_done()
+
+    def flush(self):
+        """Wait for the writer thread's queued and in-flight appends, then write anything left.
+
+        Called at exit (and by batch jobs before they exit), since the
+        writer is a daemon thread and would otherwise be cut off mid-append.
+        Also replays the spill file.
+        """
+        if self._writer_alive():
+            self.queue.join()
+        rows, batches = [], []
+        while True:
+            try:
+                row = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(row, _RowBatch):
+                batches.append(row)
+            else:
+                rows.append(row)
+        try:
+            if rows or batches or os.path.exists(self.spill_file):
+                self._write(rows)
+            for batch in batches:
+                self._write(batch)
+        finally:
+            for _ in range(len(rows) + len(batches)):
+                self.queue.task_done()
+
+    def _write(self, rows):
+        with self._write_lock:
+            self._replay_spilled()
+            if rows:
+                kept = self._append_or_keep(list(rows))
+                if kept:
+                    self._spill(kept)
+
+    def _append_or_keep(self, rows):
+        """Append rows, quarantining any Sheets rejects; return the rows that failed with a retryable error."""
+        try:
+            self._append_with_retry(rows)
+            return []
+        except Exception as e:
+            if is_retryable(e):
+                print(f"❌ Error logging {len(rows)} row(s) to Google Sheets:", str(e))
+                traceback.print_exc()
+                return rows
+            elif len(rows) > 1:
+                # Find the rejected row(s) so the rest of the batch still gets written.
+                middle = len(rows) // 2
+                return self._append_or_keep(rows[:middle]) + self._append_or_keep(rows[middle:])
+            else:
+                print("❌ Google Sheets rejected a log row; quarantining it:", str(e))
+                self._quarantine(rows, e)
+                return []
+
+    def _append_with_retry(self, rows):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.client().values().append(
+                    spreadsheetId=self.spreadsheet_id,
+                    range=self.sheet_range,
+                    valueInputOption="RAW",
+                    body={"values": rows}
+                ).execute()
+                return
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(e)
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = min(30, 2 ** attempt) * (0.5 + random.random())
+                print(f"⏳ Sheets append failed ({e}); retrying in {delay:.1f}s")
+                self.sleep(delay)
+
+    def _spill(self, rows):
+        with self._spill_lock, open(self.spill_file, "a", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+    def _quarantine(self, rows, error):
+        with self._spill_lock, open(self.rejected_file, "a", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            for row in rows:
+                f.write(json.dumps({"error": str(error), "row": row}) + "\n")
+
+    def _replay_spilled(self):
+        """Append the spilled rows in one batch, removing them from the spill file only once they are written.
+
+        A worker killed mid-replay leaves the rows in place for the next
+        replay. Only one process replays at a time; the others skip it.
+        """
+        if not os.path.exists(self.spill_file):
+            return
+        with open(self.spill_file + ".lock", "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            spilled = self._read_spilled()
+            if not spilled:
+                return
+            print(f"🔁 Replaying {len(spilled)} spilled Sheets row(s)")
+            kept = self._append_or_keep(spilled)
+            self._drop_spilled(len(spilled), kept)
+
+    def _read_spilled(self):
+        with self._spill_lock, open(self.spill_file, "r", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _drop_spilled(self, count, kept):
+        """Replace the first `count` spilled rows with `kept`, leaving rows spilled since in place."""
+        with self._spill_lock, open(self.spill_file, "r+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            lines = [json.dumps(row) + "\n" for row in kept]
+            lines += [line for line in f if line.strip()][count:]
+            f.seek(0)
+            f.truncate()
+            f.writelines(lines)
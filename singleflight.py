@@ -0,0 +1,91 @@
+# singleflight.py
+
+import os
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+# Unset by default: callers should size the wait to the leader's own upstream deadline.
+SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv("SINGLEFLIGHT_WAIT_SECONDS", 0)) or None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one upstream call.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is in flight wait on the leader's result instead of
+    calling again. Each flight is a `concurrent.futures.Future`, so threads
+    and asyncio tasks can wait on the same flight whichever side leads.
+    Waiting past `wait_seconds` (or a per-call `timeout`) raises TimeoutError
+    (concurrent.futures or asyncio); None waits as long as the leader runs.
+    """
+
+    def __init__(self, wait_seconds=SINGLEFLIGHT_WAIT_SECONDS):
+        self.wait_seconds = wait_seconds
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "coalesced": 0, "timeouts": 0}
+
+    def _join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.stats["coalesced"] += 1
+                return flight, False
+            flight = Future()
+            self._flights[key] = flight
+            self.stats["leaders"] += 1
+            return flight, True
+
+    def _land(self, key, flight, result=None, error=None):
+        with self._lock:
+            self._flights.pop(key, None)
+        if error is not None:
+            flight.set_exception(error)
+        else:
+            flight.set_result(result)
+
+    def _timed_out(self):
+        with self._lock:
+            self.stats["timeouts"] += 1
+
+    def do(self, key, fn, timeout=None):
+        """Return (result, shared); `shared` is True when another caller's result was reused."""
+        flight, leader = self._join(key)
+        if not leader:
+            try:
+                return flight.result(timeout or self.wait_seconds), True
+            except FutureTimeoutError:
+                self._timed_out()
+                raise
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._land(key, flight, error=e)
+            raise
+        self._land(key, flight, result)
+        return result, False
+
+    async def do_async(self, key, fn, timeout=None):
+        """Coroutine form of `do`; `fn` is an async callable."""
+        flight, leader = self._join(key)
+        if not leader:
+            try:
+                flight_result = asyncio.shield(asyncio.wrap_future(flight))
+                return await asyncio.wait_for(flight_result, timeout or self.wait_seconds), True
+            except asyncio.TimeoutError:
+                self._timed_out()
+                raise
+
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._land(key, flight, error=e)
+            raise
+        self._land(key, flight, result)
+        return result, False
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, "in_flight": len(self._flights)}
@@ -0,0 +1,306 @@
+# structured_output.py
+
+import re
+import json
+
+PRODUCTS = {"ACM": "Automated Care Messaging", "ACS": "Automated Care Scheduling"}
+CANONICAL_MODULES = [
+    "ACM Messenger", "ACM Vault", "ACM Alerts", "ACM Concierge",
+    "ACS Booking", "ACS Forms", "ACS Surveys"
+]
+STANDARD_DISCLAIMER = (
+    "Note: The ROI estimates provided are based on typical industry benchmarks and assumptions for "
+    "healthcare settings. Actual ROI may vary depending on clinic size, patient volume, and specific "
+    "operational factors."
+)
+MAX_BENEFITS = 3
+
+# Streamed to the widget while GPT is still writing: whole values once complete, text as it grows.
+STREAMED_FIELDS = ("product", "feature")
+STREAMED_TEXT_FIELD = "how_it_works"
+# Fields written about the user's issue; a repair cannot fill them in blind.
+TEXT_FIELDS = ("how_it_works", "roi", "benefits")
+
+_MODULE_LOOKUP = {}
+for _module in CANONICAL_MODULES:
+    _MODULE_LOOKUP[_module.lower()] = _module
+    _MODULE_LOOKUP[_module.split(" ", 1)[1].lower()] = _module
+_NAMES = "|".join(re.escape(name) for name in CANONICAL_MODULES + list(PRODUCTS.values()))
+_DEFINITE_ARTICLE = re.compile(rf"\b[Tt]he\s+(?=(?:{_NAMES})\b)")
+
+
+class IncrementalJSONObject:
+    """Parse a GPT completion's top-level JSON object as it streams in.
+
+    Text before the opening brace (e.g. a ```json fence) and after the closing
+    brace is ignored. Each value is decoded as soon as it is complete, so
+    `fields` holds every value that parsed and `invalid` the raw text of every
+    value that did not (including one cut off by the end of the completion).
+    `feed(delta)` returns the (event, data) pairs that became available with
+    the new text: each of STREAMED_FIELDS once its value is complete, and
+    STREAMED_TEXT_FIELD as incremental text deltas.
+    """
+
+    def __init__(self):
+        self.raw = ""
+        self.fields = {}
+        self.invalid = {}
+        self.closed = False
+        self._pos = 0
+        self._state = "start"
+        self._key_start = 0
+        self._key = None
+        self._value_start = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._completed = []
+        self._text_sent = 0
+
+    @classmethod
+    def parse(cls, text):
+        parser = cls()
+        parser.feed(text)
+        return parser.finish()
+
+    def feed(self, delta):
+        self.raw += delta
+        self._scan()
+
+        events = []
+        for key in self._completed:
+            if key in STREAMED_FIELDS and key in self.fields:
+                value = self.fields[key]
+                if key == "feature" and isinstance(value, list):
+                    value = [canonical_module(feature) or feature for feature in value]
+                events.append((key, {key: value}))
+        self._completed = []
+
+        text = self._streamed_text()
+        if isinstance(text, str) and len(text) > self._text_sent:
+            events.append((STREAMED_TEXT_FIELD, {"delta": text[self._text_sent:]}))
+            self._text_sent = len(text)
+        return events
+
+    def finish(self):
+        """Mark the completion as ended; a value still open is recorded as invalid."""
+        if self._state == "value":
+            self.invalid[self._key] = self.raw[self._value_start:].strip()
+            self.fields.pop(self._key, None)
+            self._state = "end"
+        return self
+
+    def _scan(self):
+        raw = self.raw
+        while self._pos < len(raw):
+            i, c = self._pos, raw[self._pos]
+            state = self._state
+
+            if state == "start":
+                if c == "{":
+                    self._state = "key_or_end"
+            elif state == "key_or_end":
+                if c == '"':
+                    self._state, self._key_start, self._escape = "key", i, False
+                elif c == "}":
+                    self.closed, self._state = True, "end"
+            elif state == "key":
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._key = json.loads(raw[self._key_start:i + 1])
+                    self._state = "colon"
+            elif state == "colon":
+                if c == ":":
+                    self._state = "value_start"
+            elif state == "value_start":
+                if not c.isspace():
+                    self._state, self._value_start = "value", i
+                    self._depth, self._in_string, self._escape = 0, False, False
+                    continue  # let the "value" state see this character too
+            elif state == "value":
+                self._scan_value(i, c)
+            else:
+                return
+            self._pos += 1
+
+    def _scan_value(self, i, c):
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif c == "\\":
+                self._escape = True
+            elif c == '"':
+                self._in_string = False
+                if self._depth == 0:
+                    self._finish_value(i + 1)
+        elif c == '"':
+            self._in_string = True
+        elif c in "[{":
+            self._depth += 1
+        elif c in "]}":
+            if self._depth == 0:
+                # A bare scalar ended by the object's closing brace.
+                self._finish_value(i)
+                self.closed, self._state = True, "end"
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_value(i + 1)
+        elif c == "," and self._depth == 0:
+            self._finish_value(i)
+
+    def _finish_value(self, end):
+        fragment = self.raw[self._value_start:end].strip()
+        try:
+            self.fields[self._key] = json.loads(fragment)
+            self.invalid.pop(self._key, None)
+        except json.JSONDecodeError:
+            self.invalid[self._key] = fragment
+        self._completed.append(self._key)
+        self._state = "key_or_end"
+
+    def _streamed_text(self):
+        """Decode as much of STREAMED_TEXT_FIELD as has arrived, complete or not."""
+        if STREAMED_TEXT_FIELD in self.fields:
+            return self.fields[STREAMED_TEXT_FIELD]
+        if self._state != "value" or self._key != STREAMED_TEXT_FIELD or self.raw[self._value_start] != '"':
+            return None
+
+        raw = self.raw[self._value_start + 1:]
+        end = 0
+        while end < len(raw):
+            if raw[end] == "\\":
+                width = 6 if raw[end + 1:end + 2] == "u" else 2
+                if end + width > len(raw):
+                    break
+                end += width
+                continue
+            end += 1
+        try:
+            return json.loads(f'"{raw[:end]}"')
+        except json.JSONDecodeError:
+            return None
+
+
+def canonical_module(name):
+    """Return the canonical module name for `name` ("the acm vault", "Vault", ...), or None."""
+    if not isinstance(name, str):
+        return None
+    key = re.sub(r"^the\s+", "", name.strip(), flags=re.IGNORECASE).lower()
+    return _MODULE_LOOKUP.get(key)
+
+
+def attributed_product(modules):
+    """Apply the prompt's product-attribution rule to a list of canonical modules."""
+    families = {module.split(" ", 1)[0] for module in modules}
+    return ", ".join(PRODUCTS[family] for family in PRODUCTS if family in families)
+
+
+def drop_definite_articles(text):
+    return _DEFINITE_ARTICLE.sub("", text)
+
+
+def validate_solution(fields):
+    """Check parsed GPT fields against the solution schema.
+
+    Returns (solution, problems). `solution` has every field that passed,
+    normalized: module names made canonical, the product derived from the
+    modules by the attribution rule, "the" dropped before product and module
+    names, benefits capped at MAX_BENEFITS and a missing disclaimer replaced
+    by the standard one. `problems` maps each field that could not be fixed
+    without GPT to the reason it failed.
+    """
+    solution, problems = {}, {}
+
+    features = fields.get("feature")
+    if isinstance(features, str):
+        features = [part for part in features.split(",") if part.strip()]
+    if not isinstance(features, list) or not features:
+        problems["feature"] = "must be a non-empty list of module names"
+    else:
+        modules = [canonical_module(feature) for feature in features]
+        unknown = [feature for feature, module in zip(features, modules) if module is None]
+        if unknown:
+            problems["feature"] = f"unknown module name(s): {', '.join(map(str, unknown))}"
+        else:
+            solution["feature"] = list(dict.fromkeys(modules))
+            solution["product"] = attributed_product(solution["feature"])
+
+    if "product" not in solution:
+        product = fields.get("product")
+        parts = [part.strip() for part in product.split(",")] if isinstance(product, str) else []
+        if parts and all(part in PRODUCTS.values() for part in parts):
+            solution["product"] = product
+        else:
+            problems["product"] = f"must be one of: {', '.join(PRODUCTS.values())}"
+
+    for field in ("how_it_works", "roi"):
+        value = fields.get(field)
+        if isinstance(value, str) and value.strip():
+            solution[field] = drop_definite_articles(value.strip())
+        else:
+            problems[field] = "must be a non-empty string"
+
+    benefits = fields.get("benefits")
+    if isinstance(benefits, str):
+        benefits = [line.strip(" -•\t") for line in benefits.splitlines()]
+    if isinstance(benefits, list):
+        benefits = [drop_definite_articles(b.strip()) for b in benefits if isinstance(b, str) and b.strip()]
+    else:
+        benefits = None
+    if benefits:
+        solution["benefits"] = benefits[:MAX_BENEFITS]
+    else:
+        problems["benefits"] = f"must be a list of 1-{MAX_BENEFITS} short strings"
+
+    disclaimer = fields.get("disclaimer")
+    solution["disclaimer"] = disclaimer.strip() if isinstance(disclaimer, str) and disclaimer.strip() else STANDARD_DISCLAIMER
+
+    return solution, problems
+
+
+def _blank(fragment):
+    if fragment is None:
+        return True
+    try:
+        value = json.loads(fragment)
+    except json.JSONDecodeError:
+        return not fragment.strip()
+    if isinstance(value, list):
+        return not any(isinstance(item, str) and item.strip() for item in value)
+    return not (value.strip() if isinstance(value, str) else value)
+
+
+def repair_prompt(problems, fragments, solution, message=None):
+    """A short prompt asking GPT to fix only the invalid fields.
+
+    It carries the invalid fragments (not the full prompt), plus the valid
+    modules when the text fields need context. The original issue is only
+    included when a text field is missing or empty, since there is then
+    nothing to fix and GPT has to write it from scratch.
+    """
+    lines = [
+        "You fix fields of a JSON answer that failed validation.",
+        f"Valid module names: {', '.join(CANONICAL_MODULES)}.",
+        f"Valid products: {', '.join(PRODUCTS.values())}.",
+        "Do not put \"the\" before product or module names.",
+        "Respond ONLY with a JSON object containing exactly these keys, with corrected values:"
+    ]
+    for field, reason in problems.items():
+        fragment = fragments.get(field)
+        lines.append(f'- "{field}" ({reason}); was: {fragment if fragment is not None else "missing"}')
+    if "feature" in solution and set(problems) - {"feature", "product"}:
+        lines.append(f"The answer uses these modules: {', '.join(solution['feature'])}.")
+    if message and any(field in problems and _blank(fragments.get(field)) for field in TEXT_FIELDS):
+        lines.append(f"The user's issue: {json.dumps(message)}")
+    return "\n".join(lines)
+
+
+def raw_fragments(parser):
+    """The raw text each field had in the completion, for fields that decoded and those that did not."""
+    fragments = {key: json.dumps(value) for key, value in parser.fields.items()}
+    fragments.update(parser.invalid)
+    return fragments
@@ -0,0 +1,131 @@
+import openai
+import pytest
+
+import admission
+from admission import AdmissionController, Busy
+
+
+class FakeClock:
+    """A monotonic clock that only moves when the controller sleeps."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_controller(clock, rpm=60, tpm=1_000_000, **kwargs):
+    # With the default 10s burst, rpm=60 admits 10 calls at once and then one per second.
+    return AdmissionController("gpt-test", rpm, tpm, clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def rate_limit_error():
+    return openai.error.RateLimitError("Rate limit reached", http_status=429)
+
+
+def test_calls_within_the_burst_are_admitted_without_waiting(clock):
+    controller = make_controller(clock)
+
+    results = [controller.call(lambda: "ok", 100) for _ in range(10)]
+
+    assert results == ["ok"] * 10
+    assert clock.sleeps == []
+    assert controller.stats["admitted"] == 10
+
+
+def test_call_waits_for_its_reservation_when_the_bucket_is_empty(clock):
+    controller = make_controller(clock)
+    for _ in range(10):
+        controller.call(lambda: "ok", 100)
+
+    assert controller.call(lambda: "late", 100) == "late"
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+
+def test_sheds_when_the_queue_is_full_with_the_wait_as_retry_after(clock):
+    controller = make_controller(clock, max_queue=0)
+    for _ in range(10):
+        controller.call(lambda: "ok", 100)
+
+    with pytest.raises(Busy) as shed:
+        controller.call(lambda: "never", 100)
+
+    assert shed.value.reason == "queue_full"
+    assert shed.value.retry_after == 1
+    assert controller.stats["shed"] == 1
+    assert clock.sleeps == []
+
+
+def test_sheds_when_the_wait_would_pass_the_deadline(clock):
+    # 6 rpm: one request every 10s once the burst is spent.
+    controller = make_controller(clock, rpm=6)
+    controller.call(lambda: "ok", 100)
+
+    with pytest.raises(Busy) as shed:
+        controller.call(lambda: "never", 100, max_wait_seconds=2)
+
+    assert shed.value.reason == "deadline"
+    assert shed.value.retry_after == 10
+    assert clock.sleeps == []
+
+
+def test_token_budget_also_limits_admission(clock):
+    # 600 tpm with a 10s burst holds 100 tokens.
+    controller = make_controller(clock, tpm=600)
+    controller.call(lambda: "ok", 100)
+
+    with pytest.raises(Busy) as shed:
+        controller.call(lambda: "never", 50, max_wait_seconds=1)
+
+    assert shed.value.reason == "deadline"
+    assert shed.value.retry_after == 5
+
+
+def test_a_429_drains_the_buckets_and_is_retried(clock, monkeypatch):
+    monkeypatch.setattr(admission.random, "random", lambda: 0.5)
+    controller = make_controller(clock)
+    attempts = []
+
+    def flaky():
+        attempts.append(clock())
+        if len(attempts) == 1:
+            raise rate_limit_error()
+        return "ok"
+
+    assert controller.call(flaky, 100) == "ok"
+    assert controller.stats["rate_limited"] == 1
+    # 0.5s backoff; the drained request bucket then needs another 0.5s to refill one request.
+    assert clock.sleeps == [pytest.approx(0.5), pytest.approx(0.5)]
+
+
+def test_429s_past_the_deadline_shed_with_the_backoff_as_retry_after(clock, monkeypatch):
+    monkeypatch.setattr(admission.random, "random", lambda: 0.5)
+    controller = make_controller(clock)
+
+    def always_limited():
+        raise rate_limit_error()
+
+    with pytest.raises(Busy) as shed:
+        controller.call(always_limited, 100, max_wait_seconds=2.5)
+
+    assert shed.value.reason == "rate_limited"
+    # Backoffs of 0.5s and 1s fit in the 2.5s deadline; the third (2s) would not.
+    assert controller.stats["rate_limited"] == 3
+    assert shed.value.retry_after == 2
+    assert clock() - 1000.0 <= 2.5
+
+
+def test_retry_after_rounds_up_to_whole_seconds():
+    assert Busy("queue_full", 0.2).retry_after == 1
+    assert Busy("deadline", 7.3).retry_after == 8
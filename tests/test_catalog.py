@@ -0,0 +1,40 @@
+import pytest
+
+from catalog import CatalogIndex, catalog_solution
+
+
+@pytest.fixture(scope="module")
+def index():
+    return CatalogIndex.from_file()
+
+
+@pytest.mark.parametrize("message, issue", [
+    ("high no-show rates", "High no-show rates in clinics"),
+    ("our clinic has high no-show rates", "High no-show rates in clinics"),
+    ("we lack secure messaging for sensitive info", "Lack of secure messaging for sensitive info"),
+    ("limited communication channels with patients", "Limited patient communication channels"),
+    ("how to solve patients missing follow-up appointments", "Patients missing follow-up appointments"),
+    # template filler and generic words must not pick an issue
+    ("related patient", None),
+    ("solve patient", None),
+    ("in healthcare patient", None),
+    ("patient satisfaction", None),
+    ("patients", None),
+    ("what is the weather like today", None),
+])
+def test_match(index, message, issue):
+    match = index.match(message)
+    assert (match[0]["issue"] if match else None) == issue
+
+
+def test_placeholder_roi_is_treated_as_missing(index):
+    entry, _ = index.match("high no-show rates")
+    assert any("$X" in benefit for benefit in entry["benefits"])
+    assert catalog_solution(entry)["roi"] == "N/A"
+
+
+def test_real_roi_is_kept():
+    entry = {"benefits": ["Fewer calls", "ROI: Saves $12,000/year in staff time."]}
+    solution = catalog_solution(entry)
+    assert solution["roi"] == "Saves $12,000/year in staff time."
+    assert solution["benefits"] == ["Fewer calls"]
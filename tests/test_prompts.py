@@ -0,0 +1,47 @@
+import pytest
+
+from prompts import PromptAssembler
+
+
+@pytest.fixture(scope="module")
+def assembler():
+    return PromptAssembler()
+
+
+@pytest.mark.parametrize("message, expected", [
+    # no-show wording in its many forms
+    ("High no-show rates", {"no_show", "acm_alerts"}),
+    ("patients miss appointments and we lose revenue", {"no_show", "acm_alerts"}),
+    ("Patients missing appointments", {"no_show", "acm_alerts"}),
+    ("too many patients missed their visits last month", {"no_show"}),
+    ("our patients keep forgetting their appointments", {"no_show"}),
+    ("people skipping appointments", {"no_show"}),
+    ("clients often fail to show up", {"no_show"}),
+    # other rules
+    ("families want to know when mom is notified", {"family_portal", "acm_alerts"}),
+    ("we need to remind patients about flu shots", {"reminder_communication", "audience_filtering"}),
+    ("patients are confused about prep before a colonoscopy", {"unprepared_patient"}),
+    ("staff spend hours on manual phone calls", {"automation_efficiency"}),
+    ("We want to integrate with our EMR", {"ehr_integration"}),
+    ("patients should check in from the parking lot", {"check_in"}),
+    ("we want patients to reply to confirm", {"two_way_messaging", "acm_alerts"}),
+    ("help drafting message templates", {"ai_message_assistant"}),
+    ("sensitive lab results", set()),  # acm_vault is core anyway
+    # generic words that used to fire unrelated instructions
+    ("we want to use ai to write better messages", set()),
+    ("my son called about the bill", set()),
+    ("we need an update on pricing", set()),
+    ("patients leave and return", set()),
+    ("who will answer the phone", set()),
+    ("the tone of our website", set()),
+    ("hello", set()),
+])
+def test_selected_instructions(assembler, message, expected):
+    names = assembler.select(message)
+    assert names[0] == "acm_vault"
+    assert set(names[1:]) == expected
+
+
+def test_selection_is_in_registry_order(assembler):
+    names = assembler.select("families keep missing appointments and we need reminders")
+    assert names == [name for name in assembler.order if name in names]
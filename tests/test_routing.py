@@ -0,0 +1,125 @@
+import time
+import threading
+
+import pytest
+
+from admission import Busy
+from routing import ModelRouter, LatencyBudgetExceeded
+
+VALID = '{"product": "ok"}'
+
+
+class StubModels:
+    """A `call` for ModelRouter whose answer per model is scripted.
+
+    Each script is a list of steps: a string to return, an exception to
+    raise, or a threading.Event to wait on before the next step.
+    """
+
+    def __init__(self, **scripts):
+        self.scripts = scripts
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, model, input_tokens, remaining_seconds):
+        with self._lock:
+            self.calls.append(model)
+        for step in self.scripts[model]:
+            if isinstance(step, threading.Event):
+                step.wait(5)
+            elif isinstance(step, Exception):
+                raise step
+            else:
+                return step
+
+
+class Abandoned:
+    def __init__(self):
+        self.calls = []
+        self.reported = threading.Event()
+
+    def __call__(self, model, raw_output, input_tokens):
+        self.calls.append((model, raw_output, input_tokens))
+        self.reported.set()
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def complete(router, models, abandoned=None):
+    return router.complete(models, lambda model: 10, lambda raw: raw == VALID, on_abandoned=abandoned)
+
+
+def make_router(budget_seconds=2.0, hedge_delay_seconds=0.05):
+    return ModelRouter(["primary", "backup"], budget_seconds=budget_seconds, hedge_delay_seconds=hedge_delay_seconds)
+
+
+def test_primary_answer_is_used_without_a_hedge():
+    models = StubModels(primary=[VALID], backup=[VALID])
+
+    assert complete(make_router(hedge_delay_seconds=1.0), models) == (VALID, "primary", 10, "primary")
+    assert models.calls == ["primary"]
+
+
+def test_slow_primary_is_hedged_and_reports_its_usage_once_when_it_finishes():
+    release = threading.Event()
+    models = StubModels(primary=[release, VALID], backup=[VALID])
+    abandoned = Abandoned()
+
+    result = complete(make_router(), models, abandoned)
+    assert result == (VALID, "backup", 10, "hedge")
+    assert abandoned.calls == []
+
+    release.set()
+    assert abandoned.reported.wait(2)
+    assert abandoned.calls == [("primary", VALID, 10)]
+
+
+def test_failed_primary_fails_over_straight_away():
+    models = StubModels(primary=[RuntimeError("upstream down")], backup=[VALID])
+
+    result = complete(make_router(hedge_delay_seconds=10.0), models)
+
+    assert result == (VALID, "backup", 10, "failover")
+
+
+def test_invalid_answer_is_reported_and_fails_over():
+    models = StubModels(primary=["not json"], backup=[VALID])
+    abandoned = Abandoned()
+
+    result = complete(make_router(hedge_delay_seconds=10.0), models, abandoned)
+
+    assert result == (VALID, "backup", 10, "failover")
+    assert abandoned.calls == [("primary", "not json", 10)]
+
+
+def test_budget_runs_out_while_every_model_is_slow():
+    release = threading.Event()
+    models = StubModels(primary=[release, VALID], backup=[release, VALID])
+    abandoned = Abandoned()
+
+    with pytest.raises(LatencyBudgetExceeded):
+        complete(make_router(budget_seconds=0.3), models, abandoned)
+
+    release.set()
+    # Both calls were still running at the deadline; each is reported once.
+    assert wait_for(lambda: len(abandoned.calls) >= 2)
+    assert sorted(model for model, _, _ in abandoned.calls) == ["backup", "primary"]
+
+
+def test_last_real_error_wins_over_busy():
+    models = StubModels(primary=[RuntimeError("upstream down")], backup=[Busy("queue_full")])
+
+    with pytest.raises(RuntimeError):
+        complete(make_router(), models)
+
+
+def test_busy_is_raised_only_when_every_model_was_busy():
+    models = StubModels(primary=[Busy("queue_full", 3)], backup=[Busy("deadline", 5)])
+
+    with pytest.raises(Busy):
+        complete(make_router(), models)
@@ -0,0 +1,182 @@
+import os
+import atexit
+import time
+
+import httplib2
+
+from fakes import FakeSheetsClient
+from sheets_logger import SheetsLogger
+
+
+def make_logger(tmp_path, client, **kwargs):
+    kwargs.setdefault("flush_seconds", 0.05)
+    kwargs.setdefault("max_retries", 2)
+    kwargs.setdefault("sleep", lambda seconds: None)
+    logger = SheetsLogger(lambda: client, "sheet-id", "Logs!A1", spill_file=str(tmp_path / "spill.jsonl"), **kwargs)
+    # Tests flush explicitly; don't replay leftover spills at interpreter exit.
+    atexit.unregister(logger.flush)
+    return logger
+
+
+def spilled_rows(logger):
+    return logger._read_spilled() if os.path.exists(logger.spill_file) else []
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_enqueued_rows_are_written_in_one_append(tmp_path):
+    client = FakeSheetsClient()
+    logger = make_logger(tmp_path, client, flush_seconds=0.2)
+
+    for i in range(5):
+        logger.enqueue([i])
+
+    assert wait_for(lambda: len(client.rows) == 5)
+    assert client.calls == 1
+    assert client.rows == [[0], [1], [2], [3], [4]]
+
+
+def test_batches_are_capped_at_batch_size(tmp_path):
+    client = FakeSheetsClient()
+    logger = make_logger(tmp_path, client, batch_size=2, flush_seconds=0.2)
+
+    for i in range(5):
+        logger.enqueue([i])
+
+    assert wait_for(lambda: len(client.rows) == 5)
+    assert client.calls == 3
+
+
+def test_enqueued_batch_gets_an_append_of_its_own(tmp_path):
+    client = FakeSheetsClient()
+    logger = make_logger(tmp_path, client, flush_seconds=0.2)
+
+    logger.enqueue(["single"])
+    logger.enqueue_batch([[i] for i in range(3)])
+    logger.flush()
+
+    assert client.calls == 2
+    assert client.rows == [["single"], [0], [1], [2]]
+
+
+def test_flush_waits_for_an_append_already_in_flight(tmp_path):
+    client = FakeSheetsClient(latency_ms=300)
+    logger = make_logger(tmp_path, client)
+
+    logger.enqueue_batch([["a"], ["b"]])
+    assert wait_for(logger.queue.empty)
+    logger.flush()
+
+    assert client.rows == [["a"], ["b"]]
+
+
+def test_retryable_errors_are_retried(tmp_path):
+    client = FakeSheetsClient(fail_times=2, status=429)
+    errors, sleeps = [], []
+    logger = make_logger(tmp_path, client, on_error=errors.append, sleep=sleeps.append)
+
+    logger.enqueue_batch([["a"], ["b"]])
+    logger.flush()
+
+    assert client.rows == [["a"], ["b"]]
+    assert client.calls == 3
+    assert len(errors) == 2
+    assert len(sleeps) == 2
+    assert spilled_rows(logger) == []
+
+
+def test_rows_are_spilled_when_retries_run_out_and_replayed_separately(tmp_path):
+    # The writer's append and flush's replay of the spill both run out of retries.
+    client = FakeSheetsClient(fail_times=6, status=503)
+    logger = make_logger(tmp_path, client)
+
+    logger.enqueue_batch([["lost"]])
+    logger.flush()
+    assert client.rows == []
+    assert spilled_rows(logger) == [["lost"]]
+
+    logger.enqueue_batch([["next"]])
+    logger.flush()
+    assert client.rows == [["lost"], ["next"]]
+    # The replay goes out in its own append, ahead of the new rows.
+    assert client.calls == 8
+    assert spilled_rows(logger) == []
+
+
+def test_failed_replay_keeps_the_spilled_rows_once(tmp_path):
+    client = FakeSheetsClient(fail_times=100, status=503)
+    logger = make_logger(tmp_path, client)
+
+    logger.enqueue_batch([["lost"]])
+    logger.flush()
+    logger.enqueue_batch([["next"]])
+    logger.flush()
+
+    assert client.rows == []
+    assert spilled_rows(logger) == [["lost"], ["next"]]
+
+
+class UnreachableSheetsClient(FakeSheetsClient):
+    """Fails every append the way httplib2 does when Google cannot be reached."""
+
+    def _execute(self, rows):
+        with self._lock:
+            self.calls += 1
+        raise httplib2.ServerNotFoundError("Unable to find the server at sheets.googleapis.com")
+
+
+def test_outage_errors_spill_instead_of_quarantining(tmp_path):
+    logger = make_logger(tmp_path, UnreachableSheetsClient())
+
+    logger.enqueue_batch([["a"], ["b"], ["c"]])
+    logger.flush()
+
+    assert spilled_rows(logger) == [["a"], ["b"], ["c"]]
+    assert not os.path.exists(logger.rejected_file)
+
+
+def test_flush_replays_the_spill_file(tmp_path):
+    client = FakeSheetsClient(fail_times=3, status=500)
+    logger = make_logger(tmp_path, client)
+
+    logger.enqueue_batch([["spilled"]])
+    logger.flush()
+
+    assert client.rows == [["spilled"]]
+    assert client.calls == 4
+    assert spilled_rows(logger) == []
+
+
+class RejectingSheetsClient(FakeSheetsClient):
+    """Rejects (400) any append that contains a row starting with "bad"."""
+
+    def _execute(self, rows):
+        with self._lock:
+            self.calls += 1
+        if any(row and row[0] == "bad" for row in rows):
+            raise self.error(400)
+        with self._lock:
+            self.rows.extend(rows)
+        return {"updates": {"updatedRows": len(rows)}}
+
+
+def test_rejected_rows_are_quarantined_and_do_not_block_logging(tmp_path):
+    client = RejectingSheetsClient()
+    logger = make_logger(tmp_path, client)
+
+    logger.enqueue_batch([["ok-1"], ["bad"], ["ok-2"], ["ok-3"]])
+    logger.flush()
+    logger.enqueue(["later"])
+    logger.flush()
+
+    assert client.rows == [["ok-1"], ["ok-2"], ["ok-3"], ["later"]]
+    assert spilled_rows(logger) == []
+    with open(logger.rejected_file, encoding="utf-8") as f:
+        rejected = f.read()
+    assert '"row": ["bad"]' in rejected
+    assert "400" in rejected
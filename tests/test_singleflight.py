@@ -0,0 +1,113 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_concurrent_threads_share_one_call():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        futures = [pool.submit(flights.do, "key", slow) for _ in range(5)]
+        assert wait_for(lambda: flights.stats["coalesced"] == 4)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert calls == [1]
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert {result for result, _ in results} == {"answer"}
+    assert flights.snapshot() == {"leaders": 1, "coalesced": 4, "timeouts": 0, "in_flight": 0}
+
+
+def test_asyncio_task_waits_on_a_thread_led_flight():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "from thread"
+
+    async def follower():
+        async def never():
+            raise AssertionError("the follower must not call upstream")
+        task = asyncio.ensure_future(flights.do_async("key", never))
+        await asyncio.sleep(0.05)
+        release.set()
+        return await task
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        leader = pool.submit(flights.do, "key", slow)
+        assert started.wait(5)
+        assert asyncio.run(follower()) == ("from thread", True)
+        assert leader.result() == ("from thread", False)
+
+
+def test_thread_waits_on_an_asyncio_led_flight():
+    flights = SingleFlight()
+    results = []
+
+    async def leader():
+        async def slow():
+            await asyncio.sleep(0.2)
+            return "from task"
+        follower = threading.Thread(target=lambda: results.append(flights.do("key", lambda: "called")))
+        flight = asyncio.ensure_future(flights.do_async("key", slow))
+        await asyncio.sleep(0.05)
+        follower.start()
+        answer = await flight
+        await asyncio.get_running_loop().run_in_executor(None, follower.join, 5)
+        return answer
+
+    assert asyncio.run(leader()) == ("from task", False)
+    assert results == [("from task", True)]
+
+
+def test_waiting_past_the_timeout_raises_and_is_counted():
+    flights = SingleFlight(wait_seconds=0.05)
+    release = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        leader = pool.submit(flights.do, "key", lambda: release.wait(5) and "late")
+        assert wait_for(lambda: flights.snapshot()["in_flight"] == 1)
+        with pytest.raises(FutureTimeoutError):
+            flights.do("key", lambda: "called")
+        release.set()
+        assert leader.result() == ("late", False)
+
+    assert flights.stats["timeouts"] == 1
+
+
+def test_leader_error_reaches_every_waiter():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(flights.do, "key", failing) for _ in range(2)]
+        assert wait_for(lambda: flights.stats["coalesced"] == 1)
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result()
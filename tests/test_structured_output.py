@@ -0,0 +1,138 @@
+import json
+import random
+
+import pytest
+
+from structured_output import (
+    IncrementalJSONObject, validate_solution, repair_prompt, raw_fragments, STANDARD_DISCLAIMER
+)
+
+ANSWER = {
+    "product": "Automated Care Messaging",
+    "feature": ["ACM Alerts", "ACM Vault"],
+    "how_it_works": "ACM Alerts sends a \"heads up\" to café staff\nand families.",
+    "benefits": ["Fewer calls", "Faster updates"],
+    "roi": "Saves 5 hours/week.",
+    "disclaimer": "Custom disclaimer."
+}
+COMPLETION = "```json\n" + json.dumps(ANSWER, ensure_ascii=False) + "\n```"
+
+
+def feed_in_chunks(text, seed):
+    rng = random.Random(seed)
+    parser, events, i = IncrementalJSONObject(), [], 0
+    while i < len(text):
+        size = rng.randint(1, 6)
+        events += parser.feed(text[i:i + size])
+        i += size
+    return parser.finish(), events
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_chunked_feed_matches_a_whole_parse(seed):
+    parser, events = feed_in_chunks(COMPLETION, seed)
+
+    assert parser.fields == ANSWER
+    assert parser.invalid == {}
+    assert parser.closed
+    assert [event for event, _ in events if event != "how_it_works"] == ["product", "feature"]
+    text = "".join(data["delta"] for event, data in events if event == "how_it_works")
+    assert text == ANSWER["how_it_works"]
+
+
+def test_escapes_split_across_chunks_are_not_streamed_half_decoded():
+    parser = IncrementalJSONObject()
+    deltas = []
+    for chunk in ['{"how_it_works": "caf', '\\u00', 'e9 \\', '"ok\\"', '"}']:
+        deltas += [data["delta"] for event, data in parser.feed(chunk) if event == "how_it_works"]
+    assert "".join(deltas) == 'café "ok"'
+
+
+def test_truncated_value_is_invalid():
+    parser = IncrementalJSONObject.parse('{"product": "Automated Care Messaging", "roi": "cut off he')
+
+    assert parser.fields == {"product": "Automated Care Messaging"}
+    assert parser.invalid == {"roi": '"cut off he'}
+    assert not parser.closed
+
+
+def test_undecodable_value_is_invalid_and_the_rest_still_parses():
+    parser = IncrementalJSONObject.parse('{"benefits": [one, two], "roi": "10%"}')
+
+    assert parser.fields == {"roi": "10%"}
+    assert parser.invalid == {"benefits": "[one, two]"}
+    assert raw_fragments(parser) == {"roi": '"10%"', "benefits": "[one, two]"}
+
+
+def test_text_without_an_object_has_no_fields():
+    assert IncrementalJSONObject.parse("Sorry, I can't help with that.").fields == {}
+
+
+def test_valid_answer_is_normalized():
+    fields = {**ANSWER, "feature": ["the acm alerts", "Vault", "ACM Alerts"], "benefits": ["a", "b", "c", "d"],
+              "how_it_works": "Use the ACM Alerts module."}
+    del fields["disclaimer"]
+
+    solution, problems = validate_solution(fields)
+
+    assert problems == {}
+    assert solution["feature"] == ["ACM Alerts", "ACM Vault"]
+    assert solution["how_it_works"] == "Use ACM Alerts module."
+    assert solution["benefits"] == ["a", "b", "c"]
+    assert solution["disclaimer"] == STANDARD_DISCLAIMER
+
+
+@pytest.mark.parametrize("modules, given_product, expected", [
+    (["ACM Alerts"], "Automated Care Scheduling", "Automated Care Messaging"),
+    (["ACS Forms"], "Automated Care Messaging", "Automated Care Scheduling"),
+    (["ACS Booking", "ACM Vault"], "Automated Care Messaging",
+     "Automated Care Messaging, Automated Care Scheduling"),
+])
+def test_product_follows_the_modules(modules, given_product, expected):
+    solution, problems = validate_solution({**ANSWER, "feature": modules, "product": given_product})
+
+    assert problems == {}
+    assert solution["product"] == expected
+
+
+def test_unknown_module_is_a_problem_and_a_valid_product_is_kept():
+    solution, problems = validate_solution({**ANSWER, "feature": ["ACM Alerts", "ACM Pager"]})
+
+    assert problems == {"feature": "unknown module name(s): ACM Pager"}
+    assert solution["product"] == "Automated Care Messaging"
+
+
+@pytest.mark.parametrize("benefits", [None, "", [], ["  "], {"a": "b"}, 3])
+def test_unusable_benefits_are_a_problem(benefits):
+    solution, problems = validate_solution({**ANSWER, "benefits": benefits})
+
+    assert "benefits" in problems
+    assert "benefits" not in solution
+
+
+def test_benefits_given_as_text_are_split_into_lines():
+    solution, problems = validate_solution({**ANSWER, "benefits": "- Fewer calls\n• Faster updates\n"})
+
+    assert problems == {}
+    assert solution["benefits"] == ["Fewer calls", "Faster updates"]
+
+
+def test_repair_prompt_carries_the_invalid_fragments_only():
+    prompt = repair_prompt(
+        {"feature": "unknown module name(s): ACM Pager"}, {"feature": '["ACM Pager"]', "roi": '"10%"'}, {},
+        "our no-show rate is high"
+    )
+
+    assert '"feature" (unknown module name(s): ACM Pager); was: ["ACM Pager"]' in prompt
+    assert "roi" not in prompt
+    assert "no-show" not in prompt
+
+
+@pytest.mark.parametrize("fragment", [None, '""', '"  "', "[]", '[""]'])
+def test_repair_prompt_includes_the_issue_when_a_text_field_is_blank(fragment):
+    fragments = {} if fragment is None else {"roi": fragment}
+    prompt = repair_prompt({"roi": "must be a non-empty string"}, fragments, {"feature": ["ACM Alerts"]},
+                           "our no-show rate is high")
+
+    assert 'The user\'s issue: "our no-show rate is high"' in prompt
+    assert "The answer uses these modules: ACM Alerts." in prompt
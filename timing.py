@@ -0,0 +1,48 @@
+# timing.py
+
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context
+
+# Callables invoked as observer(stage_name, seconds) for every finished stage.
+stage_observers = []
+
+
+@contextmanager
+def stage(name):
+    """Time a block of request handling.
+
+    Durations are kept on the request (and reported in the Server-Timing
+    response header) and passed to every registered stage observer.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if has_request_context():
+            timings = g.setdefault("stage_timings", {})
+            timings[name] = timings.get(name, 0.0) + elapsed
+        for observer in stage_observers:
+            observer(name, elapsed)
+
+
+def server_timing_header():
+    """Format this request's stage timings as a Server-Timing header value (milliseconds)."""
+    timings = g.get("stage_timings") or {}
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+def parse_server_timing(header):
+    """Parse a Server-Timing header into {stage: milliseconds}."""
+    timings = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if name and key == "dur":
+                try:
+                    timings[name] = float(value)
+                except ValueError:
+                    pass
+    return timings
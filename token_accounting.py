@@ -0,0 +1,90 @@
+# token_accounting.py
+
+import os
+import json
+import threading
+from functools import lru_cache
+import tiktoken
+
+DEFAULT_MODEL_PRICES = {
+    # USD per 1K tokens
+    "gpt-4": {"input": 0.03, "output": 0.06},
+    "gpt-4-turbo": {"input": 0.01, "output": 0.03},
+    "gpt-4o": {"input": 0.005, "output": 0.015},
+    "gpt-4o-mini": {"input": 0.00015, "output": 0.0006},
+    "gpt-3.5-turbo": {"input": 0.0005, "output": 0.0015}
+}
+FALLBACK_PRICE = {"input": 0.03, "output": 0.06}
+MAX_TRACKED_PAGE_URLS = int(os.getenv("MAX_TRACKED_PAGE_URLS", 500))
+
+
+def load_model_prices():
+    """Default price table, overridden per model by the MODEL_PRICES JSON env var."""
+    prices = {model: dict(price) for model, price in DEFAULT_MODEL_PRICES.items()}
+    override = os.getenv("MODEL_PRICES")
+    if override:
+        try:
+            for model, price in json.loads(override).items():
+                prices[model] = {"input": float(price["input"]), "output": float(price["output"])}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            print("❌ Ignoring invalid MODEL_PRICES:", str(e))
+    return prices
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model="gpt-4"):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model="gpt-4"):
+    return len(get_encoding(model).encode(text))
+
+
+class TokenAccountant:
+    """Prices completions and keeps running token/cost totals.
+
+    Totals are kept per model, per endpoint and per page_url for the life of
+    the worker process. Token counts of static prompt text are computed once
+    and remembered, so per request only the user message and the completion
+    need to be encoded.
+    """
+
+    def __init__(self, prices=None):
+        self.prices = prices if prices is not None else load_model_prices()
+        self._static_counts = {}
+        self._lock = threading.Lock()
+        self.totals = {"model": {}, "endpoint": {}, "page_url": {}}
+
+    def static_tokens(self, name, text, model="gpt-4"):
+        key = (name, model)
+        if key not in self._static_counts:
+            self._static_counts[key] = count_tokens(text, model)
+        return self._static_counts[key]
+
+    def cost(self, model, input_tokens, output_tokens=0):
+        price = self.prices.get(model, FALLBACK_PRICE)
+        return round((input_tokens / 1000) * price["input"] + (output_tokens / 1000) * price["output"], 5)
+
+    def record(self, model, input_tokens, output_tokens=0, endpoint="/ai", page_url=""):
+        cost = self.cost(model, input_tokens, output_tokens)
+        with self._lock:
+            page_totals = self.totals["page_url"]
+            page_key = page_url or "N/A"
+            if page_key not in page_totals and len(page_totals) >= MAX_TRACKED_PAGE_URLS:
+                page_key = "other"
+            for dimension, key in (("model", model), ("endpoint", endpoint), ("page_url", page_key)):
+                bucket = self.totals[dimension].setdefault(
+                    key, {"requests": 0, "input_tokens": 0, "output_tokens": 0, "cost": 0.0}
+                )
+                bucket["requests"] += 1
+                bucket["input_tokens"] += input_tokens
+                bucket["output_tokens"] += output_tokens
+                bucket["cost"] = round(bucket["cost"] + cost, 5)
+        return cost
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self.totals))
@@ -0,0 +1,100 @@
+# warmup.py
+
+import time
+import threading
+
+PROCESS_STARTED_AT = time.time()
+
+
+class Lazy:
+    """A resource built on first use, at most once, safely across threads.
+
+    A failed build is not remembered, so the next `get()` tries again.
+    """
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._value = self.factory()
+                    self._loaded = True
+        return self._value
+
+
+class WarmUp:
+    """Runs the expensive start-up steps once and reports readiness.
+
+    Each step is (name, fn, required). A failing optional step is recorded
+    but does not keep the process from becoming ready; its resource is
+    simply built on first use instead. Calling `run()` again retries only the
+    steps that failed.
+    """
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.timings = {}
+        self.errors = {}
+        self.ready_at = None
+        self.first_request_at = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self._done.is_set() and not any(
+            name in self.errors for name, _, required in self.steps if required
+        )
+
+    def run(self):
+        with self._lock:
+            if self._done.is_set() and not self.errors:
+                return self.ready
+            for name, fn, required in self.steps:
+                if name in self.timings and name not in self.errors:
+                    continue
+                start = time.perf_counter()
+                try:
+                    fn()
+                    self.errors.pop(name, None)
+                except Exception as e:
+                    self.errors[name] = str(e)
+                    print(f"{'❌' if required else '⚠️'} Warm-up step {name} failed:", str(e))
+                self.timings[name] = round(time.perf_counter() - start, 4)
+            self.ready_at = time.time()
+            self._done.set()
+        print(f"🔥 Warm-up finished in {sum(self.timings.values()):.2f}s "
+              f"({self.ready_at - PROCESS_STARTED_AT:.2f}s after start): {self.timings}")
+        return self.ready
+
+    def start_background(self):
+        thread = threading.Thread(target=self.run, name="warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def mark_request(self):
+        if self.first_request_at is None:
+            self.first_request_at = time.time()
+            print(f"⏱️ First request {self.first_request_at - PROCESS_STARTED_AT:.2f}s after start")
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "warmed_up": self._done.is_set(),
+            "steps_seconds": dict(self.timings),
+            "errors": dict(self.errors),
+            "seconds_to_ready": round(self.ready_at - PROCESS_STARTED_AT, 3) if self.ready_at else None,
+            "seconds_to_first_request": (
+                round(self.first_request_at - PROCESS_STARTED_AT, 3) if self.first_request_at else None
+            )
+        }